@@ -0,0 +1,92 @@
+# Measures the cold-start import cost of the app with `python -X importtime` in fresh interpreters and exits non-zero when a module
+# goes over its budget or when a module that is meant to load lazily (requests, pyodbc, pytz) is imported at startup again.
+#
+#   python -m benchmarks.bench_import_time
+#   python -m benchmarks.bench_import_time --module src.services.service_container --budget-ms 80 --top 15
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+# module imported at cold start -> budget in milliseconds for its cumulative import time (median of the runs)
+# function_app is dominated by azure.functions itself, service_container is everything the first invocation imports
+DEFAULT_BUDGETS_MS = {
+    "function_app": 250,
+    "src.services.service_container": 120,
+}
+
+# loaded with the first HTTP call, SQL connection or never
+LAZY_MODULES = ("requests", "urllib3", "pyodbc", "pytz")
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+# Imports the module in a fresh interpreter and returns [(module, self us, cumulative us, depth)] in the order -X importtime reports them
+def import_profile(module):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.splitlines()[-1] if result.stderr else ''}")
+
+    profile = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            profile.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return profile
+
+
+# Cumulative time of the module's own import tree: the top-level entries reported after the interpreter's site import
+def cumulative_us(profile):
+    names = [name for name, _, _, _ in profile]
+    start = names.index("site") + 1 if "site" in names else 0
+    return sum(cumulative for _, _, cumulative, depth in profile[start:] if depth == 0)
+
+
+def check_module(module, budget_ms, runs, top):
+    try:
+        import_profile(module) # warm-up, writes the .pyc files so every measured run is a cold interpreter with warm bytecode
+        profiles = [import_profile(module) for _ in range(runs)]
+    except RuntimeError as e:
+        return [str(e)]
+    median_ms = statistics.median(cumulative_us(profile) for profile in profiles) / 1000
+
+    print(f"\n{module}: {median_ms:.1f} ms median of {runs} runs (budget {budget_ms} ms)")
+    heaviest = sorted(profiles[-1], key=lambda entry: entry[1], reverse=True)[:top]
+    for name, self_us, cumulative, _ in heaviest:
+        print(f"  {self_us / 1000:7.1f} ms self {cumulative / 1000:8.1f} ms cumulative  {name}")
+
+    failures = []
+    if median_ms > budget_ms:
+        failures.append(f"{module} imports in {median_ms:.1f} ms, over its {budget_ms} ms budget")
+
+    imported = {name for name, _, _, _ in profiles[-1]}
+    for lazy_module in LAZY_MODULES:
+        if lazy_module in imported:
+            failures.append(f"{module} imports {lazy_module} at startup, it should only load when its stage runs")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the cold-start import time of the app against a budget")
+    parser.add_argument("--module", action="append", help="module to check (repeatable), defaults to the cold-start entry points")
+    parser.add_argument("--budget-ms", type=float, help="budget for every checked module instead of the defaults")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=10, help="heaviest modules to list by self time")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.module or list(DEFAULT_BUDGETS_MS):
+        budget_ms = args.budget_ms or DEFAULT_BUDGETS_MS.get(module, 120)
+        failures.extend(check_module(module, budget_ms, args.runs, args.top))
+
+    if failures:
+        print("\nFAILED")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nOK, within budget")
+
+
+if __name__ == "__main__":
+    main()
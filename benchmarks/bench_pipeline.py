@@ -0,0 +1,161 @@
+# Compares the sync and async PIPELINE_MODEs of MeetingService on stand-in clients that sleep for a fixed latency per API call.
+# No credentials or network are needed, the numbers show how much Graph, ClickUp, OpenAI and SQL latency each mode overlaps.
+#
+#   python -m benchmarks.bench_pipeline --users 8 --events 6 --latency-ms 40 --summary-ms 400
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from src.core.config import Config
+from src.models.run import RunWindow
+from src.models.transcript import SpeakerTurn
+from src.parsers.event_parser import parse_event
+from src.services import meeting_service
+from src.services.meeting_service import MeetingService
+
+LATENCY = 0.04
+SUMMARY_LATENCY = 0.4
+
+
+def pause(seconds=None):
+    time.sleep(LATENCY if seconds is None else seconds)
+
+
+class StandInGraph:
+
+    def __init__(self, events_per_user):
+        self.events_per_user = events_per_user
+
+    def get_user_id_by_email(self, email, get_value):
+        return email if get_value == "id" else email.split("@")[0].title()
+
+    # two pages per user, every event finished yesterday and tagged as a client meeting
+    def get_outlook_metadata_pages(self, user, start_date, end_date, categories=None, stats=None):
+        end = datetime.now(timezone.utc) - timedelta(days=1)
+        events = [parse_event({
+            "id": f"{user}-{i}",
+            "subject": f"Client meeting {i}",
+            "start": {"dateTime": (end - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S.0000000')},
+            "end": {"dateTime": end.strftime('%Y-%m-%dT%H:%M:%S.0000000')},
+            "categories": ["Client - Retainer"],
+            "onlineMeeting": {"joinUrl": f"https://teams.microsoft.com/l/meetup-join/{user}-{i}"},
+            "attendees": [{"emailAddress": {"address": f"client{i}@example.com"}}],
+        }) for i in range(self.events_per_user)]
+        half = len(events) // 2
+        for page in (events[:half], events[half:]):
+            pause()
+            yield page
+
+    def get_transcript_content_url(self, user_id, join_url, start_date, end_date):
+        pause()
+        return join_url
+
+    def get_transcript_turns(self, vtt_url):
+        pause()
+        return iter([SpeakerTurn("Adviser", "00:00:00.000", "00:00:04.000", f"Notes for {vtt_url}"), SpeakerTurn("Client", "00:00:04.000", "00:00:08.000", "Thanks.")])
+
+
+class StandInClickUp:
+
+    rate_limit_wait_seconds = 0.0
+    requests_saved = 0
+
+    def create_clickup_task(self, *args):
+        pause()
+        return "task"
+
+    def update_clickup_task(self, *args):
+        pause()
+
+    def find_task_by_email(self, email, folder):
+        return None
+
+    def add_task_to_temp_list(self, *args, **kwargs):
+        pause()
+
+
+class StandInOpenAI:
+
+    rate_limit_wait_seconds = 0.0
+
+    def summarize_func(self, transcript):
+        pause(SUMMARY_LATENCY)
+        return f"Summary of {len(transcript)} characters"
+
+
+class StandInSQL:
+
+    connection = cursor = True
+
+    def ensure_connection(self):
+        return True
+
+    # every event already has a pending record, so each one goes through the transcript, summarize and delivery stages
+    def sql_get_event_states(self, event_ids):
+        pause()
+        return {event_id: (0, 0, "task", 1) for event_id in event_ids}
+
+    def queue_insert_new_record(self, *args):
+        pass
+
+    def queue_update_outlook_metadata(self, *args):
+        pass
+
+    def sql_update_record(self, *args):
+        pause()
+
+    def sql_get_cached_summary(self, key):
+        pause()
+        return None
+
+    def sql_save_cached_summary(self, *args):
+        pause()
+
+    def flush_writes(self):
+        pause()
+        return {}
+
+    def close(self):
+        pass
+
+
+def run(mode, users, events, workers):
+    Config.PIPELINE_MODE = mode
+    service = MeetingService(StandInGraph(events), StandInClickUp(), StandInOpenAI(), StandInSQL())
+    service.max_user_workers = workers
+
+    utc_now = datetime.now(timezone.utc)
+    window = RunWindow(utc_now, "start", "end", "start")
+    active_users = [{"name": f"adviser{i}@example.com", "ai_meeting_notes_folder_id": "folder", "active": "Yes"} for i in range(users)]
+
+    started = time.perf_counter()
+    results = service.run_users(active_users, window)
+    seconds = time.perf_counter() - started
+    summarized = sum(result.events_summarized for result in results)
+    errors = sum(1 for result in results if result.error)
+    return seconds, summarized, errors
+
+
+def main():
+    global LATENCY, SUMMARY_LATENCY
+
+    parser = argparse.ArgumentParser(description="Compare the sync and async pipeline modes on stand-in clients")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--events", type=int, default=6, help="finished client meetings per user")
+    parser.add_argument("--latency-ms", type=float, default=40, help="latency of every Graph, ClickUp and SQL call")
+    parser.add_argument("--summary-ms", type=float, default=400, help="latency of one summarization")
+    parser.add_argument("--workers", type=int, default=4, help="MAX_USER_WORKERS for the threaded sync run")
+    args = parser.parse_args()
+
+    LATENCY = args.latency_ms / 1000
+    SUMMARY_LATENCY = args.summary_ms / 1000
+    meeting_service.AzureSQLClient = StandInSQL # per-thread connections of the threaded sync run
+
+    print(f"{args.users} users x {args.events} events, {args.latency_ms:.0f} ms per call, {args.summary_ms:.0f} ms per summary")
+    for label, mode, workers in (("sync", "sync", 1), (f"sync, {args.workers} threads", "sync", args.workers), ("async", "async", 1)):
+        seconds, summarized, errors = run(mode, args.users, args.events, workers)
+        print(f"  {label:<18} {seconds:6.2f}s  summarized: {summarized}  users with errors: {errors}")
+
+
+if __name__ == "__main__":
+    main()
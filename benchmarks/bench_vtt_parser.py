@@ -0,0 +1,72 @@
+# Compares the original whole-document regex VTT filter with the streaming iter_vtt_turns parser on a synthetic Teams transcript.
+# Reports wall time and peak Python memory (tracemalloc) for both paths.
+#
+#   python -m benchmarks.bench_vtt_parser --hours 3
+import argparse
+import io
+import re
+import time
+import tracemalloc
+
+from src.parsers.vtt_parser import iter_vtt_turns
+
+SPEAKERS = ["Jane Doe", "John Smith", "Alex Tan", "Maria Santos"]
+
+
+# Builds a Teams-style VTT document with one cue every four seconds
+def make_vtt(hours):
+    parts = ["WEBVTT", ""]
+    for cue in range(int(hours * 3600 / 4)):
+        start = cue * 4
+        parts.append(f"{cue}-{start}")
+        parts.append(f"{start // 3600:02}:{start // 60 % 60:02}:{start % 60:02}.000 --> {(start + 4) // 3600:02}:{(start + 4) // 60 % 60:02}:{(start + 4) % 60:02}.000")
+        parts.append(f"<v {SPEAKERS[cue // 3 % len(SPEAKERS)]}>So the plan for the next quarter is to focus on the retainer clients, um, and review pricing.</v>")
+        parts.append("")
+    return "\n".join(parts)
+
+
+# The original get_filtered_vtt body: regex over the whole document, then one list of every line
+def regex_filter(vtt_content):
+    vtt_no_timestamps = re.sub(r'\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}', '', vtt_content)
+    lines = [line.strip() for line in vtt_no_timestamps.splitlines() if line.strip().startswith('<v ')]
+    return '\n'.join(lines)
+
+
+def streaming_filter(stream):
+    return '\n'.join(f"<v {turn.speaker}>{turn.text}</v>" for turn in iter_vtt_turns(stream))
+
+
+# Times fn on its own (tracemalloc slows allocation-heavy code down) and then runs it again under tracemalloc, returns (result, seconds, peak bytes)
+def measure(fn):
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the regex and streaming VTT filters")
+    parser.add_argument("--hours", type=float, default=3.0, help="length of the synthetic meeting")
+    args = parser.parse_args()
+
+    vtt = make_vtt(args.hours)
+    vtt_bytes = vtt.encode("utf-8")
+    print(f"Synthetic transcript: {args.hours}h, {len(vtt_bytes) / 1024:.0f} KiB")
+
+    # the regex path needs the decoded document (response.text), the streaming path reads lines off the byte stream (response.iter_lines)
+    regex_result, regex_seconds, regex_peak = measure(lambda: regex_filter(vtt_bytes.decode("utf-8")))
+    stream_result, stream_seconds, stream_peak = measure(lambda: streaming_filter(io.BytesIO(vtt_bytes)))
+
+    print(f"{'path':<10} {'seconds':>8} {'peak KiB':>9}")
+    print(f"{'regex':<10} {regex_seconds:>8.3f} {regex_peak / 1024:>9.0f}")
+    print(f"{'streaming':<10} {stream_seconds:>8.3f} {stream_peak / 1024:>9.0f}")
+    print(f"Output identical: {regex_result == stream_result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,51 @@
 import logging
+import typing
 import azure.functions as func
-from src.services.meeting_service import MeetingService
 from src.core.logger import setup_logger
 
 setup_logger()
 
 app = func.FunctionApp()
 
+WORK_QUEUE_NAME = "meeting-work-items" # Storage queue between the dispatcher timer and process_work_item
+
 @app.timer_trigger(schedule="0 */15 22-23,0-7 * * 1-5",
                    arg_name="myTimer",
                    run_on_startup=True,
                    use_monitor=False) 
+@app.queue_output(arg_name="workItems",
+                  queue_name=WORK_QUEUE_NAME,
+                  connection="AzureWebJobsStorage")
 
-def timer_trigger(myTimer: func.TimerRequest) -> None:
+def timer_trigger(myTimer: func.TimerRequest, workItems: func.Out[typing.List[str]]) -> None:
     
     if myTimer.past_due:
         logging.info('The timer is past due!')
 
-    service = MeetingService()
-    service.main()
+    from src.core.config import Config
+    from src.services.service_container import get_meeting_service # the pipeline modules load on the first invocation, not at indexing
 
-    logging.info('Python timer trigger function executed.')
+    service = get_meeting_service() # reused across invocations on a warm instance
+
+    # with QUEUE_FANOUT set the timer only dispatches, process_work_item runs the work on as many instances as the queue needs
+    if Config.QUEUE_FANOUT:
+        from src.services.queue_service import QueueService
+        workItems.set(QueueService(service).dispatch(Config.QUEUE_FANOUT))
+    else:
+        service.main()
 
+    logging.info('Python timer trigger function executed.')
 
 
+@app.queue_trigger(arg_name="workItem",
+                   queue_name=WORK_QUEUE_NAME,
+                   connection="AzureWebJobsStorage")
 
+def process_work_item(workItem: func.QueueMessage) -> None:
 
-@function_app.timer_trigger(schedule="0 */15 22-23,0-7 * * 1-5", arg_name="myTimer", run_on_startup=False,
-              use_monitor=False) 
-def timer_trigger(myTimer: func.TimerRequest) -> None:
-    if myTimer.past_due:
-        logging.info('The timer is past due!')
+    from src.services.queue_service import QueueService
+    from src.services.service_container import get_meeting_service
 
-    logging.info('Python timer trigger function executed.')
\ No newline at end of file
+    logging.info(f"Processing work item {workItem.id} (dequeue count {workItem.dequeue_count})")
+    # the warm service only lends its API clients, the item gets its own SQL connection so it can run next to the timer
+    QueueService(get_meeting_service()).handle(workItem.get_body().decode('utf-8'))
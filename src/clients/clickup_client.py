@@ -1,12 +1,33 @@
-import requests
-import time
+import re
 import logging
+import threading
+import time
 from src.core.config import Config
+from src.clients import http_client
+from src.clients.rate_limiter import RateLimiter
+from src.database.local_cache import LocalCache
 
 logger = logging.getLogger(__name__)
 
+# shared by every ClickUpClient in the process, the API budget is per token and not per client instance
+clickup_rate_limiter = RateLimiter("ClickUp", Config.CLICKUP_RATE_LIMIT)
+
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+
+
+# Normalizes an email address so index keys and lookups compare equal regardless of case or surrounding whitespace
+def normalize_email(email):
+    return email.strip().lower()
+
+
 class ClickUpClient:
 
+    CASELOAD_VIEW_ID = "8cewk4m-13996"
+    CASELOAD_MAX_PAGES = 12
+    MAX_RETRIES = Config.CLICKUP_MAX_RETRIES
+    FULL_UPDATE_REQUESTS = 5 # four custom field POSTs and one task PUT
+    FOLDER_MISS_REFRESH = 300 # seconds after which a list name missing from the cached folder triggers one refetch
+
     # This class provides methods to interact with the ClickUp API, including creating and updating tasks, retrieving user lists, and handling rate limits.
     def __init__(self):
         self.api_token = Config.CLICKUP_API_TOKEN
@@ -29,83 +50,128 @@ class ClickUpClient:
         self.BA_LIST = Config.BA_LIST
         self.OTHERS_LIST_ID = Config.OTHERS_LIST_ID
 
+        # users list, folder id -> {list name: list id} and folder status -> {normalized email: task name}, persisted across invocations
+        self.cache = LocalCache(Config.LOCAL_CACHE_PATH)
+        self.users_ttl = Config.CLICKUP_USERS_CACHE_TTL
+        self.folder_ttl = Config.CLICKUP_FOLDER_CACHE_TTL
+        self.caseload_ttl = Config.CLICKUP_CASELOAD_TTL
+        self._caseload_lock = threading.Lock()
+
+        # task id -> (remembered_at, last known custom field values, description and status), used to skip unchanged updates
+        self.task_state_ttl = Config.CLICKUP_TASK_STATE_TTL
+        self._task_state = {}
+        self._task_state_lock = threading.Lock()
+        self.requests_saved = 0
+
+
+    # Seconds all ClickUp calls in this process have spent waiting on the shared rate limiter
+    @property
+    def rate_limit_wait_seconds(self):
+        return clickup_rate_limiter.wait_seconds
+
 
     # This function handles all ClickUp API requests and implements rate limit handling
+    # Every request first takes a slot from the process-wide limiter, 429 responses are retried after the reset-aware delay
     def request_clickup(self, action, url, headers, json=False):
 
-        if action == 'Get':
-            response = requests.get(url, headers=headers)
-        elif action == 'Post':
-            response = requests.post(url, headers=headers, json=json)
-        elif action == 'Put':
-            response = requests.put(url, headers=headers, json=json)
-        else:
+        if action not in ('Get', 'Post', 'Put'):
             raise ValueError(f"Unsupported action: {action}")
 
-        while True:
-            limit = response.headers.get("X-RateLimit-Limit")
-            remaining = response.headers.get("X-RateLimit-Remaining")
-            int_remaining = int(remaining)
-            logger.info(f"ClickUp Rate Limit: {remaining}/{limit} remaining")
-            
-            if response.status_code == 429 or int_remaining < 20:
-                time.sleep(30)
-                continue
+        for attempt in range(self.MAX_RETRIES + 1):
+            clickup_rate_limiter.acquire()
 
-            return response
+            if action == 'Get':
+                response = http_client.get(url, headers=headers)
+            elif action == 'Post':
+                response = http_client.post(url, headers=headers, json=json)
+            else:
+                response = http_client.put(url, headers=headers, json=json)
 
+            clickup_rate_limiter.update(response.headers)
+            if response.status_code != 429:
+                return response
 
-    # This function retrieves the list of users from ClickUp and returns their names as a list
-    def get_users(self):
+            delay = clickup_rate_limiter.retry_delay(response)
+            logger.warning(f"ClickUp rate limited (attempt {attempt + 1}), retrying in {delay:.1f}s")
+            clickup_rate_limiter.wait(delay)
+
+        logger.error(f"ClickUp request still rate limited after {self.MAX_RETRIES} retries: {url}")
+        return response
+
+
+    # This function returns a cached response of a ClickUp GET, transformed by parse, while it is younger than ttl seconds
+    # Expired entries are revalidated with If-None-Match when an ETag was stored (304 keeps the entry), a failed request serves the stale entry if there is one
+    def get_cached(self, namespace, key, url, ttl, parse):
+
+        cached = self.cache.get(namespace, key)
+        if cached and cached.age < ttl:
+            return cached.value
 
-        url = f'{self.base_url}/list/{self.users_list_id}/task'
         headers = {
             'Authorization': self.api_token,
             'Content-Type': 'application/json'
         }
+        if cached and cached.etag:
+            headers['If-None-Match'] = cached.etag
 
         response = self.request_clickup('Get', url, headers)
-        # if response.status_code == 200:
-        #     tasks = response.json().get('tasks', [])
-        #     userID = [task['name'] for task in tasks]
-        #     return userID
-        # else:
-        #     logger.error(f"Failed to retrieve user list. Status code: {response.status_code}")
-        if response.status_code == 200:
-            tasks = response.json().get('tasks', [])
-            result = []
+        if response.status_code == 304 and cached:
+            self.cache.touch(namespace, key)
+            return cached.value
 
-            for task in tasks:
-                user_name = task.get('name')
+        if response.status_code != 200:
+            logger.error(f"Failed to retrieve {namespace} {key}. Status code: {response.status_code}")
+            if cached:
+                logger.info(f"Using cached {namespace} {key} from {cached.age:.0f}s ago.")
+                return cached.value
+            return None
 
-                ai_folder_id = None
-                active_value = None
+        value = parse(response.json())
+        self.cache.set(namespace, key, value, response.headers.get('ETag'))
+        return value
 
-                for field in task.get('custom_fields', []):
-                    if field.get('name') == "AI Meeting Notes Folder ID":
-                        ai_folder_id = field.get('value')
 
-                    elif field.get('name') == "Active":
-                        value = field.get('value')
-                        options = field.get('type_config', {}).get('options', [])
+    # This function retrieves the list of users from ClickUp and returns their names as a list
+    # The list is cached for CLICKUP_USERS_CACHE_TTL seconds
+    def get_users(self):
 
-                        # Map index to option name (value = index)
-                        if value is not None and value < len(options):
-                            active_value = options[value].get('name')
-                        else:
-                            active_value = None
+        url = f'{self.base_url}/list/{self.users_list_id}/task'
+        return self.get_cached("users", self.users_list_id or "", url, self.users_ttl, self.parse_users)
 
-                result.append({
-                    "name": user_name,
-                    "ai_meeting_notes_folder_id": ai_folder_id,
-                    "active": active_value
-                })
 
-            return result
+    # This function turns the users list tasks into dicts of name, AI Meeting Notes folder ID and Active status
+    def parse_users(self, data):
 
-        else:
-            logger.error(f"Failed to retrieve tasks. Status code: {response.status_code}")
-            return None
+        tasks = data.get('tasks', [])
+        result = []
+
+        for task in tasks:
+            user_name = task.get('name')
+
+            ai_folder_id = None
+            active_value = None
+
+            for field in task.get('custom_fields', []):
+                if field.get('name') == "AI Meeting Notes Folder ID":
+                    ai_folder_id = field.get('value')
+
+                elif field.get('name') == "Active":
+                    value = field.get('value')
+                    options = field.get('type_config', {}).get('options', [])
+
+                    # Map index to option name (value = index)
+                    if value is not None and value < len(options):
+                        active_value = options[value].get('name')
+                    else:
+                        active_value = None
+
+            result.append({
+                "name": user_name,
+                "ai_meeting_notes_folder_id": ai_folder_id,
+                "active": active_value
+            })
+
+        return result
 
     # This function creates a new task in ClickUp with the provided details and returns the task ID
     def create_clickup_task (self, subject, user, is_organizer, is_cancelled, formatted_st, duration_str, categories_str, attendees_str, transcript_found, ai_api_done, summarized_transcript, clickup_api_done):
@@ -175,6 +241,11 @@ class ClickUpClient:
             logger.info("Task created successfully!")
             task = response.json()
             task_id = task['id']
+
+            state = {field['id']: field['value'] for field in payload['custom_fields']}
+            state['description'] = payload['description']
+            state['status'] = payload['status']
+            self._remember_task_state(task_id, state)
             return (task_id)
         else:
             logger.error("Failed to create task.")
@@ -182,7 +253,37 @@ class ClickUpClient:
             logger.error(f"Response: {response.text}")
 
 
+    def _remember_task_state(self, task_id, state):
+        with self._task_state_lock:
+            self._task_state[task_id] = (time.monotonic(), state)
+
+
+    # Forgets the state of tasks not created or updated within CLICKUP_TASK_STATE_TTL, so the map does not grow on a warm instance
+    def prune_task_state(self):
+
+        expired_before = time.monotonic() - self.task_state_ttl
+        with self._task_state_lock:
+            for task_id in [task_id for task_id, (remembered_at, _) in self._task_state.items() if remembered_at < expired_before]:
+                del self._task_state[task_id]
+
+
+    # Adds to the number of ClickUp requests avoided by diffing task updates against the known task state
+    def _record_requests_saved(self, count):
+        with self._task_state_lock:
+            self.requests_saved += count
+
+
+    # This function returns the last known custom field values, description and status of a task
+    # Tasks created or updated by this process are answered from memory, any other task returns an empty state so every field is written without fetching the task first
+    def get_task_state(self, task_id):
+
+        with self._task_state_lock:
+            _, state = self._task_state.get(task_id) or (None, {})
+            return dict(state)
+
+
     # This function updates the specified ClickUp task with the provided details and marks it as complete if the clickup_api_done field is set to 'Yes'
+    # Fields, description and status that already hold the desired value are skipped, a full update costs five requests so the difference is counted as saved
     def update_clickup_task(self, clickup_task_id, transcript_found, ai_api_done, summarized_transcript, clickup_api_done):
 
         task_id = clickup_task_id
@@ -199,13 +300,22 @@ class ClickUpClient:
             'Content-Type': 'application/json'
         }
 
+        state = self.get_task_state(task_id)
+        requests_made = 0
+
         for field_id, value in custom_fields_to_update.items():
+            if state.get(field_id) == value:
+                logger.info(f"Custom field {field_id} already '{value}', skipped")
+                continue
+
             url = f'{self.base_url}/task/{task_id}/field/{field_id}'
             payload = {"value": value}
 
             response = self.request_clickup('Post', url, headers, payload)
+            requests_made += 1
             if response.status_code == 200:
                 logger.info(f"Custom field {field_id} updated to '{value}'")
+                state[field_id] = value
             else:
                 logger.error(f"Failed to update field {field_id}")
                 logger.error(f"Status code: {response.status_code}")
@@ -216,100 +326,133 @@ class ClickUpClient:
         else: 
             new_status = 'In Progress'
             
-        payload = {
-            "description": summarized_transcript,
-            "status": new_status
-        }
-        url = f'{self.base_url}/task/{task_id}'
-        response = self.request_clickup('Put', url, headers, payload)
-        if response.status_code == 200:
-            logger.info("Task has been updated!")
+        payload = {}
+        if state.get('description') != summarized_transcript:
+            payload["description"] = summarized_transcript
+        if (state.get('status') or '').lower() != new_status.lower():
+            payload["status"] = new_status
+
+        if payload:
+            url = f'{self.base_url}/task/{task_id}'
+            response = self.request_clickup('Put', url, headers, payload)
+            requests_made += 1
+            if response.status_code == 200:
+                logger.info("Task has been updated!")
+                state['description'] = summarized_transcript
+                state['status'] = new_status
+            else:
+                logger.error("Failed to mark task as complete.")
+                logger.error(f"Status code: {response.status_code}")
+                logger.error(f"Response: {response.text}")
         else:
-            logger.error("Failed to mark task as complete.")
-            logger.error(f"Status code: {response.status_code}")
-            logger.error(f"Response: {response.text}")
+            logger.info("Task description and status unchanged, skipped")
 
+        self._remember_task_state(task_id, state)
+        self._record_requests_saved(self.FULL_UPDATE_REQUESTS - requests_made)
 
-    # This function searches for a task in the specified ClickUp folder that has a custom field matching the target email and returns the task name if found, otherwise returns None
-    def find_task_by_email(self, target_email, folder):
 
-        logger.info(f"Searching task in Caseload Overview - {folder}: {target_email}")
+    # This function downloads every page of the "Caseload Overview" view for the given folder status and builds an index of normalized email -> task name
+    # Both the "Email" field and every address found in the "Email - Associates" field are indexed, the first task found for an address wins
+    def build_caseload_index(self, folder):
+
+        logger.info(f"Building Caseload Overview index - {folder}")
 
-        url = f"{self.base_url}/view/8cewk4m-13996/task?status={folder}"
         headers = {
             'Authorization': self.api_token,
             'Content-Type': 'application/json'
         }
 
-        response = self.request_clickup('Get', url, headers)
-
-        if response.status_code != 200:
-            logger.error(f"Failed to retrieve tasks. Status Code: {response.status_code}")
-            return None
-
-        tasks = response.json().get('tasks', [])
-
-        for task in tasks:
-            for custom_field in task.get('custom_fields', []):
-                if custom_field.get('name') == "Email" and custom_field.get('value') == target_email:
-                    logger.info(f"Task found: {task['name']}")
-                    return task['name']
-                email_value = custom_field.get('value')
-                if custom_field.get('name') == "Email - Associates" and email_value:
-                    if email_value.find(target_email) != -1:
-                        logger.info(f"Task found: {task['name']}")
-                        return task['name']
-                
-                
-        # try again using pagination maxed limit
+        index = {}
         page = 0
-        while page != 11:
-            print(page)
-            url = f"{self.base_url}/view/8cewk4m-13996/task?status={folder}&page={page}&limit=100"
+        while page < self.CASELOAD_MAX_PAGES:
+            url = f"{self.base_url}/view/{self.CASELOAD_VIEW_ID}/task?status={folder}&page={page}&limit=100"
 
             response = self.request_clickup('Get', url, headers)
             if response.status_code != 200:
                 logger.error(f"Failed to retrieve tasks. Status Code: {response.status_code}")
                 return None
 
-            tasks = response.json().get('tasks', [])
+            data = response.json()
+            tasks = data.get('tasks', [])
 
             for task in tasks:
                 for custom_field in task.get('custom_fields', []):
-                    if custom_field.get('name') == "Email" and custom_field.get('value') == target_email:
-                        logger.info(f"Task found: {task['name']}")
-                        return task['name']
                     email_value = custom_field.get('value')
-                    if custom_field.get('name') == "Email - Associates" and email_value:
-                        if email_value.find(target_email) != -1:
-                            logger.info(f"Task found: {task['name']}")
-                            return task['name']
+                    if not email_value or not isinstance(email_value, str):
+                        continue
+                    if custom_field.get('name') == "Email":
+                        index.setdefault(normalize_email(email_value), task['name'])
+                    elif custom_field.get('name') == "Email - Associates":
+                        for associate_email in EMAIL_PATTERN.findall(email_value):
+                            index.setdefault(normalize_email(associate_email), task['name'])
+
+            if not tasks or data.get('last_page'):
+                break
+            page += 1
+
+        logger.info(f"Caseload Overview index - {folder}: {len(index)} email(s) from {page + 1} page(s)")
+        return index
+
+
+    # This function returns the cached caseload index for the given folder status, rebuilding it once the configured TTL has passed
+    def get_caseload_index(self, folder):
+
+        with self._caseload_lock:
+            cached = self.cache.get("caseload", folder)
+            if cached and cached.age < self.caseload_ttl:
+                return cached.value
+
+            index = self.build_caseload_index(folder)
+            if index is None:
+                return cached.value if cached else {}
+
+            self.cache.set("caseload", folder, index)
+            return index
+
+
+    # This function searches for a task in the specified ClickUp folder that has a custom field matching the target email and returns the task name if found, otherwise returns None
+    # Lookups are answered from the in-memory caseload index, so the view is only downloaded once per folder per TTL
+    def find_task_by_email(self, target_email, folder):
+
+        logger.info(f"Searching task in Caseload Overview - {folder}: {target_email}")
+
+        if not target_email:
+            return None
+
+        task_name = self.get_caseload_index(folder).get(normalize_email(target_email))
+        if task_name:
+            logger.info(f"Task found: {task_name}")
+            return task_name
 
-            page +=1 
-        
         logger.info("Not Found")
         return None
 
 
-    # This function searches for a folder in the specified ClickUp list that matches the target task name and returns the folder ID if found, otherwise returns None
-    def find_folder_by_task_name (self, task_name, list_id):
+    # This function returns {list name: list id} for the lists in a ClickUp folder, cached for CLICKUP_FOLDER_CACHE_TTL seconds
+    def get_folder_lists(self, folder_id):
 
-        url = f"{self.base_url}/folder/{list_id}/list"
-        headers = {
-            'Authorization': self.api_token,
-            'Content-Type': 'application/json'
-        }
+        url = f"{self.base_url}/folder/{folder_id}/list"
+        return self.get_cached("folder_lists", folder_id, url, self.folder_ttl,
+                               lambda data: {list_item['name']: list_item['id'] for list_item in data.get('lists', [])})
 
-        response = self.request_clickup('Get', url, headers)
-        if response.status_code != 200:
-            logger.error(f"Failed to retrieve lists. Status Code: {response.status_code}")
+
+    # This function searches for a list in the specified ClickUp folder that matches the target task name and returns the list ID if found, otherwise returns None
+    # The name is resolved from the cached folder index, a name missing from an index older than FOLDER_MISS_REFRESH seconds refetches the folder once
+    def find_folder_by_task_name (self, task_name, list_id):
+
+        lists = self.get_folder_lists(list_id)
+        if lists is None:
             return None
 
-        lists = response.json().get('lists', [])
-        for list_item in lists:
-            if list_item['name'] == task_name:
-                logger.info(f"List found: {list_item['id']}")
-                return list_item['id']  
+        if task_name not in lists:
+            cached = self.cache.get("folder_lists", list_id)
+            if cached and cached.age >= self.FOLDER_MISS_REFRESH:
+                self.cache.delete("folder_lists", list_id)
+                lists = self.get_folder_lists(list_id) or {}
+
+        if task_name in lists:
+            logger.info(f"List found: {lists[task_name]}")
+            return lists[task_name]
 
         logger.info("Not Found")
         return None
@@ -333,10 +476,10 @@ class ClickUpClient:
         response = self.request_clickup('Post', task_url, headers, task_data)
         if response.status_code == 200:
             logger.info(f"Task '{task_name}' successfully created in list ID {list_id}.")
+            return True
         else:
             logger.error(f"Func Name: add_task_to_list | Failed to create task. Status Code: {response.status_code}")
-        
-        return None
+            return False
 
 
     # This function creates a new task in the AI Meeting Notes temporary folder with the provided task name and description, assigning it to the appropriate business advisor based on the provided name
@@ -366,7 +509,7 @@ class ClickUpClient:
         response = self.request_clickup('Post', task_url, headers, task_data)
         if response.status_code == 200:
             logger.info(f"Task '{task_name}' successfully created in list ID {ba_id}.")
+            return True
         else:
             logger.error(f"Func Name: add_task_to_temp_list | Failed to create task. Status Code: {response.status_code}")
-        
-        return None
\ No newline at end of file
+            return False
\ No newline at end of file
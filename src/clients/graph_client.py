@@ -1,125 +1,426 @@
-import requests
+import json
 import logging
-import re
+import threading
+import time
+import urllib.parse
 from src.core.config import Config
-from src.parsers.event_parser import parse_event
-from src.utils.meeting_utils import compare_meeting_ids
+from src.clients import http_client
+from src.clients.token_provider import TokenProvider
+from src.parsers.event_parser import parse_event, EVENT_FIELDS
+from src.parsers.vtt_parser import iter_vtt_turns
+from collections import deque
+from src.utils.meeting_utils import extract_meeting_id_from_join_url, extract_meeting_id_from_encoded_id
 
 logger = logging.getLogger(__name__)
 
 class GraphClient:
 
+    GRAPH_URL = "https://graph.microsoft.com/v1.0"
+    BATCH_LIMIT = 20 # maximum number of sub-requests Graph accepts in one $batch call
+    USER_FIELDS = "id,displayName,mail"
+    DELTA_PAGE_SIZE = 200
+    CALENDAR_PAGE_SIZE = 250 # events per calendarView page, later pages are followed through @odata.nextLink
+    BATCH_MAX_RETRIES = 3 # resends of a throttled (429) $batch call or sub-request
+    CALENDAR_HEADERS = {"Prefer": 'outlook.timezone="Asia/Singapore"'}
+
     def __init__(self):
-        self.client_id = Config.GRAPH_APP_CLIENT_ID
-        self.client_secret = Config.GRAPH_APP_CLIENT_SECRET
-        self.token_url = Config.GRAPH_APP_URL
-        self.token = self.get_access_token()
+        self.token_provider = TokenProvider(
+            Config.GRAPH_APP_URL,
+            Config.GRAPH_APP_CLIENT_ID,
+            Config.GRAPH_APP_CLIENT_SECRET,
+            "https://graph.microsoft.com/.default",
+            cache_path=Config.GRAPH_TOKEN_CACHE_PATH,
+            refresh_margin=Config.GRAPH_TOKEN_REFRESH_MARGIN
+        ) # the first token is requested by the first Graph call
+
+        # normalized email -> (fetched_at, user dict or None when Graph has no such user)
+        self.user_cache_ttl = Config.GRAPH_USER_CACHE_TTL
+        self._user_cache = {}
+        self._user_lock = threading.Lock()
+
+        # (user_id, start_date, end_date) -> (fetched_at, {decoded meeting id: transcriptContentUrl})
+        self.transcript_index_ttl = Config.GRAPH_TRANSCRIPT_INDEX_TTL
+        self._transcript_index = {}
+        self._transcript_locks = {}
+        self._transcript_lock = threading.Lock()
 
     def get_access_token(self):
+        return self.token_provider.get_token()
 
-        data = {
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'scope': "https://graph.microsoft.com/.default",
-            'grant_type': 'client_credentials'
-        }
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        response = requests.post(self.token_url, data=data, headers=headers)
 
-        if response.status_code == 200:
-            return response.json().get('access_token')
-        else:
-            print(f"Failed to obtain access token: {response.status_code}, {response.text}")
-            return None
+    # Sends a Graph request with a current access token, a 401 (token revoked or expired mid-run) refreshes the token and retries once
+    def _request(self, method, url, headers=None, **kwargs):
+
+        headers = dict(headers or {})
+        token = self.token_provider.get_token()
+        headers["Authorization"] = f"Bearer {token}"
+        response = http_client.request(method, url, headers=headers, **kwargs)
+
+        if response.status_code == 401:
+            response.close()
+            logger.info("Graph rejected the access token, refreshing it and retrying.")
+            headers["Authorization"] = f"Bearer {self.token_provider.get_token(rejected_token=token)}"
+            response = http_client.request(method, url, headers=headers, **kwargs)
+        return response
+
+    # Sends GET sub-requests through Graph $batch, BATCH_LIMIT per call, and returns key -> list of response bodies (one per page) or None when the item failed.
+    # requests maps a caller-chosen key to (path relative to GRAPH_URL, per-request headers or None). Throttled (429) sub-requests are resent after
+    # their Retry-After and @odata.nextLink pages are queued into later calls, so every key ends up with all of its pages (only the first one with follow_next_links=False)
+    def batch_get(self, requests, follow_next_links=True):
+
+        results = {key: [] for key in requests}
+        queue = deque((key, path, headers) for key, (path, headers) in requests.items())
+        retries = {}
+        calls = 0
+        throttled_calls = 0
+
+        while queue:
+            chunk = [queue.popleft() for _ in range(min(self.BATCH_LIMIT, len(queue)))]
+            payload = {"requests": []}
+            for i, (key, path, headers) in enumerate(chunk):
+                sub_request = {"id": str(i), "method": "GET", "url": path}
+                if headers:
+                    sub_request["headers"] = headers
+                payload["requests"].append(sub_request)
 
-    def get_outlook_metadata(self, user, start_date, end_date):
+            response = self._request("POST", f"{self.GRAPH_URL}/$batch", headers={"Content-Type": "application/json"}, json=payload)
+            calls += 1
 
-        calendar_events = []
-        events = []
+            if response.status_code == 429 and throttled_calls < self.BATCH_MAX_RETRIES:
+                throttled_calls += 1
+                delay = int(response.headers.get("Retry-After", 5))
+                logger.info(f"$batch call throttled, retrying in {delay}s")
+                queue.extendleft(reversed(chunk))
+                time.sleep(delay)
+                continue
+            if response.status_code != 200:
+                logger.error(f"$batch call failed: {response.status_code} - {response.text}")
+                for key, _, _ in chunk:
+                    results[key] = None
+                continue
 
-        url = f"https://graph.microsoft.com/v1.0/users/{user}/calendarview?$top=1000&$count=true&startDateTime={start_date}&endDateTime={end_date}"
+            throttled_calls = 0
+            retry_after = 0
+            for item in response.json().get("responses", []):
+                key, path, headers = chunk[int(item.get("id"))]
+                status = item.get("status")
+
+                if status == 429 and retries.get(key, 0) < self.BATCH_MAX_RETRIES:
+                    retries[key] = retries.get(key, 0) + 1
+                    item_headers = {name.lower(): value for name, value in (item.get("headers") or {}).items()}
+                    retry_after = max(retry_after, int(item_headers.get("retry-after", 1)))
+                    queue.append((key, path, headers))
+                    continue
+                if status != 200:
+                    logger.error(f"$batch sub-request {path} failed: {status} - {item.get('body')}")
+                    results[key] = None
+                    continue
+                if results[key] is None: # an earlier page of this key failed
+                    continue
+
+                body = item.get("body") or {}
+                results[key].append(body)
+                next_link = body.get("@odata.nextLink")
+                if next_link and follow_next_links:
+                    queue.append((key, next_link[len(self.GRAPH_URL):] if next_link.startswith(self.GRAPH_URL) else next_link, headers))
+
+            if retry_after and queue:
+                logger.info(f"{len(retries)} $batch sub-request(s) throttled, retrying in {retry_after}s")
+                time.sleep(retry_after)
+
+        logger.info(f"$batch: {len(requests)} request(s) answered in {calls} call(s)")
+        return results
+
+
+    # Builds the OData filter keeping events tagged with any of the categories, Graph compares category names as exact values
+    def _category_filter(self, categories):
+        clauses = " or ".join("c eq '{}'".format(category.replace("'", "''")) for category in categories)
+        return f"categories/any(c:{clauses})"
+
+
+    # Downloads the user's calendar view page by page, following @odata.nextLink, and yields each page as a list of EventDetails as soon as it is parsed.
+    # Only the EVENT_FIELDS parse_event reads are requested ($select). When categories are given they are filtered server-side, if Graph rejects
+    # the filter this request is repeated without it and the caller's own category check does the filtering, the next request tries the filter again.
+    # Payload bytes, event count, page count and parse time are added to the optional stats dict.
+    # Pass the @odata.nextLink of an already downloaded page as next_link to continue from there
+    def get_outlook_metadata_pages(self, user, start_date, end_date, categories=None, stats=None, next_link=None):
+
+        server_filter = bool(categories)
+        url = next_link or f"{self.GRAPH_URL}{self._calendar_view_path(user, start_date, end_date, categories)}"
         headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Prefer": 'outlook.timezone="Asia/Singapore"',
+            **self.CALENDAR_HEADERS,
             "Content-Type": "application/json"
         }
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
+
+        page_number = 0
+        while url:
+            response = self._request("GET", url, headers=headers)
+            if server_filter and not next_link and page_number == 0 and response.status_code in (400, 501):
+                logger.warning(f"Graph rejected the category filter for {user} ({response.status_code}), filtering this calendar client-side.")
+                yield from self.get_outlook_metadata_pages(user, start_date, end_date, None, stats)
+                return
+
+            if response.status_code != 200:
+                logger.error(f"Couldn't get Outlook calendar view metadata (page {page_number + 1}) -  {response.status_code}: {response.text}")
+                return
+
+            started = time.perf_counter()
             data = response.json()
             events = data.get("value", [])
-            for event in events:
-                calendar_events.append(parse_event(event))
-        else:
-            print(f"Couldn't get Outlook calendar view metadata -  {response.status_code}: {response.text}")
+            calendar_events = [parse_event(event) for event in events]
+            parse_seconds = time.perf_counter() - started
+            page_number += 1
 
-        return calendar_events
-    
+            logger.info(f"Calendar view for {user}, page {page_number}: {len(events)} event(s), {len(response.content) / 1024:.1f} KiB, parsed in {parse_seconds * 1000:.1f} ms, category filter: {'server' if server_filter else 'client'}")
+            if stats is not None:
+                stats["bytes"] = stats.get("bytes", 0) + len(response.content)
+                stats["events"] = stats.get("events", 0) + len(events)
+                stats["pages"] = stats.get("pages", 0) + 1
+                stats["parse_seconds"] = stats.get("parse_seconds", 0.0) + parse_seconds
+                stats["server_filter"] = server_filter
 
-    def get_transcript_content_url(self, user_id, join_url, start_date, end_date):
+            url = data.get("@odata.nextLink")
+            yield calendar_events
+
+
+    def _calendar_view_path(self, user, start_date, end_date, categories=None):
+        path = f"/users/{user}/calendarview?$top={self.CALENDAR_PAGE_SIZE}&startDateTime={start_date}&endDateTime={end_date}&$select={','.join(EVENT_FIELDS)}"
+        if categories:
+            path += f"&$filter={urllib.parse.quote(self._category_filter(categories))}"
+        return path
+
+
+    # Downloads the first calendar view page of many users through $batch (20 users per call) and returns user -> (events, stats, next link),
+    # with stats like get_outlook_metadata_pages'. Later pages are left to get_outlook_metadata_pages with the next link, so they stream while the
+    # first page is processed. Users whose download failed are left out so the caller can fall back to get_outlook_metadata_pages
+    def get_outlook_metadata_many(self, users, start_date, end_date, categories=None):
+
+        server_filter = bool(categories)
+        requests = {user: (self._calendar_view_path(user, start_date, end_date, categories), self.CALENDAR_HEADERS) for user in users}
+        results = self.batch_get(requests, follow_next_links=False)
+
+        if server_filter and users and all(pages is None for pages in results.values()):
+            logger.warning("Graph rejected the batched calendar requests with the category filter, retrying them without it.")
+            return self.get_outlook_metadata_many(users, start_date, end_date)
+
+        calendars = {}
+        for user, pages in results.items():
+            if pages is None:
+                continue
+            started = time.perf_counter()
+            events = [event for page in pages for event in page.get("value", [])]
+            calendar_events = [parse_event(event) for event in events]
+            parse_seconds = time.perf_counter() - started
+            payload_bytes = sum(len(json.dumps(page).encode("utf-8")) for page in pages) # re-serialized size, $batch does not expose each item's wire size
+
+            next_link = pages[-1].get("@odata.nextLink") if pages else None
 
-        url = f"https://graph.microsoft.com/v1.0/users/{user_id}/onlineMeetings/getAllTranscripts(meetingOrganizerUserId='{user_id}',startDateTime={start_date},endDateTime={end_date})"
+            logger.info(f"Calendar view for {user}, page 1: {len(events)} event(s), {payload_bytes / 1024:.1f} KiB, parsed in {parse_seconds * 1000:.1f} ms, category filter: {'server' if server_filter else 'client'}")
+            calendars[user] = (calendar_events, {"bytes": payload_bytes, "events": len(events), "pages": len(pages), "parse_seconds": parse_seconds, "server_filter": server_filter}, next_link)
 
+        return calendars
+    
+
+    # Runs a calendarView delta query and returns (changed raw events, removed event IDs, new delta link)
+    # Without a delta_link a full initial sync of the window is done, None is returned when the sync failed or the delta link has expired
+    def get_outlook_metadata_delta(self, user, start_date, end_date, delta_link=None):
+
+        url = delta_link or f"{self.GRAPH_URL}/users/{user}/calendarView/delta?startDateTime={start_date}&endDateTime={end_date}"
         headers = {
-            'Authorization': f'Bearer {self.token}',
-            'Content-Type': 'application/json'
+            "Prefer": f'outlook.timezone="Asia/Singapore", odata.maxpagesize={self.DELTA_PAGE_SIZE}',
+            "Content-Type": "application/json"
         }
 
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            logger.error(f"Failed to retrieve transcript: {response.status_code}, {response.text}")
+        changed_events = []
+        removed_ids = []
+        while True:
+            response = self._request("GET", url, headers=headers)
+            if response.status_code == 410:
+                logger.info(f"Delta token for {user} has expired, a full sync is required.")
+                return None
+            if response.status_code != 200:
+                logger.error(f"Couldn't get Outlook calendar view delta -  {response.status_code}: {response.text}")
+                return None
+
+            data = response.json()
+            for event in data.get("value", []):
+                if "@removed" in event:
+                    removed_ids.append(event.get("id"))
+                else:
+                    changed_events.append(event)
+
+            next_link = data.get("@odata.nextLink")
+            if not next_link:
+                break
+            url = next_link
+
+        logger.info(f"Calendar delta for {user}: {len(changed_events)} changed, {len(removed_ids)} removed")
+        return changed_events, removed_ids, data.get("@odata.deltaLink")
+
+
+    # Fetches every transcript the user organized in the window (following @odata.nextLink) and indexes it by the decoded meeting thread ID
+    # The index is cached per user and window for GRAPH_TRANSCRIPT_INDEX_TTL seconds, so each event only needs a dictionary lookup
+    def get_transcript_index(self, user_id, start_date, end_date):
+
+        key = (user_id, start_date, end_date)
+        with self._transcript_lock:
+            key_lock = self._transcript_locks.setdefault(key, threading.Lock())
+
+        # one lock per user and window, so concurrent users fetch in parallel while callers for the same user share one fetch
+        with key_lock:
+            cached = self._transcript_index.get(key)
+            if cached and time.monotonic() - cached[0] < self.transcript_index_ttl:
+                return cached[1]
+
+            url = f"{self.GRAPH_URL}/users/{user_id}/onlineMeetings/getAllTranscripts(meetingOrganizerUserId='{user_id}',startDateTime={start_date},endDateTime={end_date})"
+            headers = {
+                'Content-Type': 'application/json'
+            }
+
+            index = {}
+            while url:
+                response = self._request("GET", url, headers=headers)
+                if response.status_code != 200:
+                    logger.error(f"Failed to retrieve transcript: {response.status_code}, {response.text}")
+                    return None
+
+                data = response.json()
+                for meeting in data.get("value", []):
+                    meeting_id = extract_meeting_id_from_encoded_id(meeting.get("meetingId") or "")
+                    if meeting_id:
+                        index.setdefault(meeting_id, meeting.get("transcriptContentUrl"))
+
+                url = data.get("@odata.nextLink")
+
+            logger.info(f"Indexed {len(index)} transcript(s) for {user_id}")
+            self._transcript_index[key] = (time.monotonic(), index)
+            return index
+
+
+    # Drops transcript indexes older than GRAPH_TRANSCRIPT_INDEX_TTL and the locks of windows nobody is fetching, every run asks for a new window
+    def prune_transcript_index(self):
+
+        expired_before = time.monotonic() - self.transcript_index_ttl
+        with self._transcript_lock:
+            for key in [key for key, (fetched_at, _) in self._transcript_index.items() if fetched_at < expired_before]:
+                del self._transcript_index[key]
+            for key in [key for key, key_lock in self._transcript_locks.items() if key not in self._transcript_index and not key_lock.locked()]:
+                del self._transcript_locks[key]
+
+
+    def get_transcript_content_url(self, user_id, join_url, start_date, end_date):
+
+        if not join_url:
+            logger.error("Event has no join URL, unable to look up transcript..")
             return None
 
-        data = response.json()
-        # print (data)
-        for meeting in data.get("value", []):
-            meeting_id = meeting.get("meetingId")
-            logger.info(f"Checking meeting ID: {meeting_id}")
-            match = compare_meeting_ids(join_url, meeting_id)
-            
-            if match:
-                return meeting.get("transcriptContentUrl")
-        
+        index = self.get_transcript_index(user_id, start_date, end_date)
+        if index is None:
+            return None
+
+        meeting_id = extract_meeting_id_from_join_url(join_url)
+        transcript_url = index.get(meeting_id) if meeting_id else None
+        if transcript_url:
+            logger.info(f"Get Transcript: Match found! {meeting_id}")
+            return transcript_url
+
         logger.error("Unable to find meeting transcript..")
         return None
 
 
-    def get_filtered_vtt(self, vtt_url):
+    # Opens the transcript as a stream and returns an iterator of SpeakerTurn records parsed line by line, or None when the transcript cannot be fetched
+    # Memory stays flat regardless of the meeting length since the VTT document is never held as a whole
+    def get_transcript_turns(self, vtt_url):
 
         headers = {
-            'Authorization': f'Bearer {self.token}',
             'Accept': 'text/vtt'
         }
-        response = requests.get(vtt_url, headers=headers)
+        response = self._request("GET", vtt_url, headers=headers, stream=True)
 
-        if response.status_code == 200:
-            vtt_content = response.text
-            vtt_no_timestamps = re.sub(r'\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}', '', vtt_content)
-            lines = [line.strip() for line in vtt_no_timestamps.splitlines() if line.strip().startswith('<v ')]
-            logger.info("VTT retreived and cleaned.")
-            return '\n'.join(lines)
-        else:
+        if response.status_code != 200:
             logger.error(f"Unable to access vtt url: {vtt_url}")
-        return None
+            response.close()
+            return None
 
+        response.encoding = 'utf-8' # text/vtt is always UTF-8, requests would otherwise assume ISO-8859-1 for text/*
 
-    def get_user_id_by_email(self, email, get_value):
+        def turns():
+            with response:
+                yield from iter_vtt_turns(response.iter_lines(decode_unicode=True))
 
-        url = f"https://graph.microsoft.com/v1.0/users?$filter=mail eq '{email}'"
+        return turns()
+
+
+    # Returns the cached user for an email while it is still within the TTL, the second value tells whether the cache had an entry at all
+    def _get_cached_user(self, email):
+        with self._user_lock:
+            cached = self._user_cache.get(email.strip().lower())
+        if cached and time.monotonic() - cached[0] < self.user_cache_ttl:
+            return True, cached[1]
+        return False, None
+
+
+    def _cache_user(self, email, user):
+        with self._user_lock:
+            self._user_cache[email.strip().lower()] = (time.monotonic(), user)
+
+
+    def _user_filter_url(self, email):
+        user_filter = urllib.parse.quote(f"mail eq '{email}'")
+        return f"/users?$filter={user_filter}&$select={self.USER_FIELDS}"
+
+
+    # Looks up a user by email and returns a dict with both id and displayName, results are memoized per email for GRAPH_USER_CACHE_TTL seconds
+    def get_user_by_email(self, email):
+
+        found, user = self._get_cached_user(email)
+        if found:
+            return user
+
+        url = f"{self.GRAPH_URL}{self._user_filter_url(email)}"
         headers = {
-            "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
         }
 
-        response = requests.get(url, headers=headers)
+        response = self._request("GET", url, headers=headers)
 
         if response.status_code == 200:
-            data = response.json()
-            users = data.get("value", [])
-            if users:
-                return users[0].get(get_value)
-            else:
+            users = response.json().get("value", [])
+            user = users[0] if users else None
+            if not user:
                 logger.info("No user found with that email.")
-                return None
+            self._cache_user(email, user)
+            return user
         else:
             logger.error(f"Error: {response.status_code} - {response.text}")
             return None
+
+
+    # Resolves many users up front with batch_get (20 lookups per $batch call) so later lookups are answered from the cache
+    def prefetch_users(self, emails):
+
+        pending = []
+        for email in emails:
+            if email and not self._get_cached_user(email)[0] and email not in pending:
+                pending.append(email)
+
+        if not pending:
+            return
+
+        results = self.batch_get({email: (self._user_filter_url(email), None) for email in pending})
+        for email, pages in results.items():
+            if pages is None:
+                logger.error(f"User lookup failed for {email}")
+                continue
+            users = pages[0].get("value", [])
+            self._cache_user(email, users[0] if users else None)
+
+        logger.info(f"Prefetched {len(pending)} Graph user(s)")
+
+
+    def get_user_id_by_email(self, email, get_value):
+
+        user = self.get_user_by_email(email)
+        if user:
+            return user.get(get_value)
+        return None
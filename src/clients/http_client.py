@@ -0,0 +1,60 @@
+import atexit
+import threading
+import urllib.parse
+import logging
+from src.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+# host -> pooled keep-alive session shared by every API client in the process
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# Returns the session for the URL's host, creating it with a connection pool sized for the configured number of workers on first use
+def get_session(url):
+
+    host = urllib.parse.urlsplit(url).netloc.lower()
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            # requests is the slowest import of the app, it is loaded with the first HTTP call rather than at cold start
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.HTTP_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate"})
+            if not _sessions:
+                atexit.register(close_sessions)
+            _sessions[host] = session
+            logger.info(f"Opened pooled HTTP session for {host}")
+    return session
+
+
+# Sends a request over the host's pooled session, applying the default connect/read timeouts unless the caller passes its own
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT))
+    return get_session(url).request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
+
+
+# Closes every pooled session, registered with atexit when the first session is opened so the pools are closed when the process shuts down
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
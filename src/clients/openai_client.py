@@ -1,31 +1,34 @@
-import requests
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from src.core.logger import setup_logger
 from src.core.config import Config
+from src.clients import http_client
+from src.clients.rate_limiter import TokenBudgetLimiter
+from src.utils.transcript_utils import estimate_tokens, split_transcript, split_speaker_legend
 
 logger = logging.getLogger(__name__)
 
-class OpenAIClient:
+# shared by every OpenAIClient in the process, the quota belongs to the deployment and not to a client instance
+openai_rate_limiter = TokenBudgetLimiter("Azure OpenAI", Config.OPENAI_TPM_LIMIT, Config.OPENAI_RPM_LIMIT)
 
-    def __init__(self):
-        self.api_key = Config.OPENAI_API_KEY
-        self.api_url = Config.OPENAI_URL
+# caps requests in flight across the whole process at OPENAI_MAX_CONCURRENCY, summarize_pending and summarize_chunked run nested thread pools
+openai_request_slots = threading.BoundedSemaphore(max(1, Config.OPENAI_MAX_CONCURRENCY))
 
-    def summarize_func(self,transcript):
+# Bump whenever a prompt or the way transcripts are prepared changes, cached summaries of older versions are then ignored
+PROMPT_VERSION = "2"
 
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": self.api_key
-        }
-
-        promt = """
+# System prompt for summarizing a full client call transcript
+SUMMARY_PROMPT = """
         You are a business advisor specializing in business strategy and sales. Based on the transcript of a recent client call, perform the following tasks:
         Key Discussion Points: Extract and bullet point the key insights or takeaways from the conversation.
         Decisions Made: Identify any final decisions or conclusions reached during the meeting.
         Action Items: List specific tasks or follow-ups assigned to team members, including deadlines or individuals responsible.
         Summary: Summarize the transcript after listing the key points.
         Sentiment Analysis: Conduct a thorough sentiment analysis of the overall conversation.
+        The transcript may start with a SPEAKERS legend that maps short aliases (S1, S2, ...) to names. Always refer to people by their names, never by alias.
 
         Guidelines:
         Do not place the summary at the beginning.
@@ -53,21 +56,263 @@ class OpenAIClient:
 
         """
 
+# Map step of chunked summarization: notes for one part of a transcript that is too long to summarize in one request
+CHUNK_PROMPT = """
+        You are a business advisor specializing in business strategy and sales. You are given one part of a longer transcript of a recent client call.
+        Take detailed notes on this part only, they will later be combined with the notes of the other parts.
+        The part starts with a SPEAKERS legend that maps short aliases (S1, S2, ...) to names. Always refer to people by their names, never by alias.
+
+        Use this format:
+
+        KEY DISCUSSION POINTS:
+        • [value]
+
+        DECISIONS MADE:
+        • [value]
+
+        ACTION ITEMS:
+        • [value] (include individuals responsible and deadlines when mentioned)
+
+        SENTIMENT:
+        [value]
+
+        """
+
+
+BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class OpenAIClient:
+
+    def __init__(self):
+        self.api_key = Config.OPENAI_API_KEY
+        self.api_url = Config.OPENAI_URL
+        self.chunk_tokens = Config.OPENAI_CHUNK_TOKENS
+        self.max_concurrency = Config.OPENAI_MAX_CONCURRENCY
+        self.completion_tokens = Config.OPENAI_COMPLETION_TOKENS
+        self.max_retries = Config.OPENAI_MAX_RETRIES
+
+        self.batch_endpoint = (Config.OPENAI_BATCH_ENDPOINT or "").rstrip("/")
+        self.batch_deployment = Config.OPENAI_BATCH_DEPLOYMENT
+        self.batch_api_version = Config.OPENAI_BATCH_API_VERSION
+
+
+    # Seconds all completion requests in this process have spent waiting on the shared token budget
+    @property
+    def rate_limit_wait_seconds(self):
+        return openai_rate_limiter.wait_seconds
+
+
+    def _messages(self, system_prompt, content):
+        return [
+            {"role": "system", "content": f"{system_prompt}"},
+            {"role": "user", "content": f"{content}"}
+        ]
+
+
+    # Sends one chat completion with the given system prompt and user content and returns the message text, or None on failure
+    # Each request first reserves its estimated prompt + completion tokens from the shared budget, 429 responses are retried after the advertised delay
+    # At most OPENAI_MAX_CONCURRENCY requests are in flight in the process, the slot is not held while waiting out a 429
+    def complete(self, system_prompt, content):
+
+        headers = {
+            "Content-Type": "application/json",
+            "api-key": self.api_key
+        }
+
         data = {
-            "messages": [
-                {"role": "system", "content": f"{promt}"},
-                {"role": "user", "content": f"{transcript}"}
-            ],
+            "messages": self._messages(system_prompt, content),
         }
 
-        response = requests.post(self.api_url, headers=headers, data=json.dumps(data))
+        body = json.dumps(data)
+        estimated_tokens = estimate_tokens(system_prompt) + estimate_tokens(content) + self.completion_tokens
+
+        for attempt in range(self.max_retries + 1):
+            with openai_request_slots:
+                openai_rate_limiter.acquire(estimated_tokens)
+                response = http_client.post(self.api_url, headers=headers, data=body)
+                openai_rate_limiter.update(response.headers)
+            if response.status_code != 429:
+                break
+
+            delay = openai_rate_limiter.retry_delay(response)
+            logger.warning(f"OpenAI rate limited (attempt {attempt + 1}), retrying in {delay:.1f}s")
+            openai_rate_limiter.wait(delay)
 
         if response.status_code == 200:
             result = response.json()
-            summary = result['choices'][0]['message']['content']
-            logger.info("OpenAI successfully processed the summary.")
-            return summary
+            return result['choices'][0]['message']['content']
         else:
             logger.error(f"OpenAI request failed: {response.status_code}")
             logger.error(response.text)
-            return None
\ No newline at end of file
+            return None
+
+
+    # True when a transcript is above OPENAI_CHUNK_TOKENS and has to be summarized in parts
+    def needs_chunking(self, transcript):
+        return estimate_tokens(transcript) > self.chunk_tokens
+
+
+    # Summarizes a transcript in the KEY DISCUSSION POINTS / DECISIONS MADE / ACTION ITEMS / SUMMARY / SENTIMENT ANALYSIS format
+    # Transcripts above OPENAI_CHUNK_TOKENS are summarized with summarize_chunked instead of one oversized request
+    def summarize_func(self,transcript):
+
+        if self.needs_chunking(transcript):
+            return self.summarize_chunked(transcript)
+
+        summary = self.complete(SUMMARY_PROMPT, transcript)
+        if summary:
+            logger.info("OpenAI successfully processed the summary.")
+        return summary
+
+
+    # Map-reduce summarization: the transcript is split at speaker-turn boundaries, the parts are noted in parallel (OPENAI_MAX_CONCURRENCY requests at once across the process)
+    # and the notes of all parts are merged into the final summary format with one last request
+    def summarize_chunked(self, transcript):
+
+        legend, body = split_speaker_legend(transcript)
+        chunks = split_transcript(body, self.chunk_tokens, header=legend)
+        logger.info(f"Transcript of ~{estimate_tokens(transcript)} tokens split into {len(chunks)} part(s) for summarization.")
+
+        def summarize_chunk(numbered_chunk):
+            number, chunk = numbered_chunk
+            return self.complete(CHUNK_PROMPT, f"Part {number} of {len(chunks)}:\n{chunk}")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(chunks)))) as executor:
+            partial_notes = list(executor.map(summarize_chunk, enumerate(chunks, start=1)))
+
+        if any(notes is None for notes in partial_notes):
+            logger.error("OpenAI failed to summarize one or more transcript parts.")
+            return None
+
+        merged_notes = "\n\n".join(f"=== Part {number} of {len(chunks)} ===\n{notes}" for number, notes in enumerate(partial_notes, start=1))
+        content = (
+            f"The call transcript was too long to send at once, so it was split into {len(chunks)} consecutive parts and notes were taken for each part. "
+            f"Use these notes in place of the transcript.\n\n{merged_notes}"
+        )
+
+        summary = self.complete(SUMMARY_PROMPT, content)
+        if summary:
+            logger.info(f"OpenAI successfully processed the summary from {len(chunks)} part(s).")
+        return summary
+
+
+    def _batch_url(self, path):
+        return f"{self.batch_endpoint}/openai/{path}?api-version={self.batch_api_version}"
+
+
+    # Builds one line of a Batch API input file that summarizes a transcript, the custom_id is echoed back with its result
+    # The transcript is sent in one request, so it must not need chunking (see needs_chunking)
+    def build_batch_request(self, custom_id, transcript):
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/chat/completions",
+            "body": {
+                "model": self.batch_deployment,
+                "messages": self._messages(SUMMARY_PROMPT, transcript),
+            },
+        }
+
+
+    # Uploads the requests as a JSONL input file and starts a batch job against OPENAI_BATCH_ENDPOINT, returns the batch ID or None
+    def submit_batch(self, batch_requests):
+
+        jsonl = "\n".join(json.dumps(batch_request) for batch_request in batch_requests)
+
+        response = http_client.post(
+            self._batch_url("files"),
+            headers={"api-key": self.api_key},
+            data={"purpose": "batch"},
+            files={"file": ("summaries.jsonl", jsonl.encode("utf-8"), "application/jsonl")},
+        )
+        if response.status_code not in (200, 201):
+            logger.error(f"Batch input upload failed: {response.status_code}")
+            logger.error(response.text)
+            return None
+        input_file_id = response.json().get("id")
+
+        headers = {
+            "Content-Type": "application/json",
+            "api-key": self.api_key
+        }
+        payload = {
+            "input_file_id": input_file_id,
+            "endpoint": "/chat/completions",
+            "completion_window": "24h",
+        }
+        response = http_client.post(self._batch_url("batches"), headers=headers, json=payload)
+        if response.status_code not in (200, 201):
+            logger.error(f"Batch creation failed: {response.status_code}")
+            logger.error(response.text)
+            return None
+
+        batch_id = response.json().get("id")
+        logger.info(f"Submitted batch {batch_id} with {len(batch_requests)} request(s).")
+        return batch_id
+
+
+    def get_batch(self, batch_id):
+
+        response = http_client.get(self._batch_url(f"batches/{batch_id}"), headers={"api-key": self.api_key})
+        if response.status_code != 200:
+            logger.error(f"Unable to read batch {batch_id}: {response.status_code}")
+            return None
+        return response.json()
+
+
+    # Polls a batch job until it reaches a terminal status or the timeout passes, returns the last batch object seen
+    def wait_for_batch(self, batch_id, poll_seconds, timeout_seconds):
+
+        deadline = time.monotonic() + timeout_seconds
+        while True:
+            batch = self.get_batch(batch_id)
+            status = batch.get("status") if batch else None
+            counts = (batch or {}).get("request_counts") or {}
+            logger.info(f"Batch {batch_id}: {status} ({counts.get('completed', 0)}/{counts.get('total', '?')} completed)")
+
+            if status in BATCH_TERMINAL_STATUSES:
+                return batch
+            if time.monotonic() + poll_seconds > deadline:
+                logger.error(f"Batch {batch_id} did not finish within {timeout_seconds}s, resume later with its batch ID.")
+                return batch
+            time.sleep(poll_seconds)
+
+
+    # Downloads a batch output or error file and returns its JSONL items, or None when it could not be read
+    def _get_batch_file(self, file_id):
+
+        response = http_client.get(self._batch_url(f"files/{file_id}/content"), headers={"api-key": self.api_key})
+        if response.status_code != 200:
+            logger.error(f"Unable to download batch file {file_id}: {response.status_code}")
+            return None
+        return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+    # Reads the output and error files of a finished batch and returns custom_id -> summary, items that failed map to None
+    # Requests the service rejected are only listed in the error file, each one is logged with its error
+    def get_batch_results(self, batch):
+
+        batch = batch or {}
+        output_file_id = batch.get("output_file_id")
+        error_file_id = batch.get("error_file_id")
+        if not output_file_id and not error_file_id:
+            logger.error(f"Batch {batch.get('id')} has no output or error file (status: {batch.get('status')}).")
+            return {}
+
+        items = []
+        for file_id in (output_file_id, error_file_id):
+            if file_id:
+                items.extend(self._get_batch_file(file_id) or [])
+
+        results = {}
+        for item in items:
+            item_response = item.get("response") or {}
+            if item_response.get("status_code") == 200:
+                results[item["custom_id"]] = item_response["body"]["choices"][0]["message"]["content"]
+            else:
+                logger.error(f"Batch item {item.get('custom_id')} failed: {item.get('error') or item_response.get('body')}")
+                results[item["custom_id"]] = None
+
+        logger.info(f"Batch {batch.get('id')}: {sum(1 for summary in results.values() if summary)} of {len(results)} summaries succeeded.")
+        return results
@@ -0,0 +1,195 @@
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+
+    # Client-side limiter for APIs that report X-RateLimit-Limit / X-RateLimit-Remaining / X-RateLimit-Reset headers.
+    # One instance is shared by every caller of an API in the process, requests are paced so the remaining budget is spread until the reset time.
+    def __init__(self, name, limit, period=60):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.remaining = limit
+        self.reset_at = None # epoch seconds when the server refills the budget
+        self.wait_seconds = 0.0 # total time callers spent sleeping in this limiter
+
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+
+    # Blocks until the caller may send its next request
+    def acquire(self):
+
+        with self._lock:
+            now = time.time()
+            if self.reset_at and now >= self.reset_at:
+                self.remaining = self.limit
+                self.reset_at = None
+
+            if self.reset_at:
+                if self.remaining <= 0:
+                    # budget exhausted: nothing may go out before the reset
+                    self._next_slot = max(self._next_slot, self.reset_at)
+                    interval = 0.0
+                else:
+                    interval = (self.reset_at - now) / self.remaining
+            else:
+                interval = self.period / self.limit
+
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + interval
+            self.remaining -= 1
+            delay = slot - now
+
+        self.wait(delay)
+
+
+    # Updates the budget from the rate limit headers of a response
+    def update(self, headers):
+
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+
+        with self._lock:
+            try:
+                if limit is not None:
+                    self.limit = max(int(limit), 1)
+                if remaining is not None:
+                    self.remaining = int(remaining)
+                if reset is not None:
+                    self.reset_at = float(reset)
+            except ValueError:
+                logger.warning(f"{self.name}: unreadable rate limit headers {limit}/{remaining}/{reset}")
+
+        logger.info(f"{self.name} Rate Limit: {remaining}/{limit} remaining")
+
+
+    # Returns how long to wait before retrying a throttled (429) response, preferring Retry-After and falling back to the reset time
+    def retry_delay(self, response):
+
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(float(retry_after), 1.0)
+            except ValueError:
+                pass
+
+        with self._lock:
+            self.remaining = 0
+            if self.reset_at:
+                return max(self.reset_at - time.time(), 1.0)
+        return self.period / 2
+
+
+    def wait(self, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.wait_seconds += seconds
+        time.sleep(seconds)
+
+
+class TokenBudgetLimiter:
+
+    # Tokens-per-minute and requests-per-minute limiter for Azure OpenAI deployments, shared by every completion request in the process.
+    # Requests are admitted against a sliding one-minute window of the configured quota, tightened by the x-ratelimit-remaining-* headers the service returns.
+    def __init__(self, name, tokens_per_minute, requests_per_minute, window=60):
+        self.name = name
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.window = window
+        self.wait_seconds = 0.0 # total time callers spent sleeping in this limiter
+
+        self._sent = deque() # (sent_at, estimated tokens) of requests inside the window
+        self._server = None # (seen_at, remaining tokens, remaining requests) from the latest response headers
+        self._lock = threading.Lock()
+
+
+    # Returns (tokens left, requests left) in the current window, must be called with the lock held
+    def _available(self, now):
+
+        while self._sent and now - self._sent[0][0] >= self.window:
+            self._sent.popleft()
+
+        tokens_left = self.tokens_per_minute - sum(tokens for _, tokens in self._sent)
+        requests_left = self.requests_per_minute - len(self._sent)
+
+        if self._server and now - self._server[0] < self.window:
+            seen_at, server_tokens, server_requests = self._server
+            sent_since = [tokens for sent_at, tokens in self._sent if sent_at >= seen_at]
+            if server_tokens is not None:
+                tokens_left = min(tokens_left, server_tokens - sum(sent_since))
+            if server_requests is not None:
+                requests_left = min(requests_left, server_requests - len(sent_since))
+
+        return tokens_left, requests_left
+
+
+    # Blocks until a request of the given estimated size fits in both budgets
+    def acquire(self, tokens):
+
+        # a request larger than the whole quota is admitted once the window is empty instead of waiting forever
+        tokens = min(tokens, self.tokens_per_minute)
+
+        while True:
+            with self._lock:
+                now = time.time()
+                tokens_left, requests_left = self._available(now)
+                if tokens_left >= tokens and requests_left >= 1:
+                    self._sent.append((now, tokens))
+                    return
+
+                # re-check when the oldest request leaves the window, polling at most every few seconds since server headers may free budget earlier
+                delay = self._sent[0][0] + self.window - now if self._sent else 1.0
+                delay = min(max(delay, 0.1), 5.0)
+
+            logger.info(f"{self.name} budget exhausted ({tokens_left} tokens / {requests_left} requests left, {tokens} needed), waiting {delay:.1f}s")
+            self.wait(delay)
+
+
+    # Records the remaining quota reported by the response headers
+    def update(self, headers):
+
+        def header_int(name):
+            value = headers.get(name)
+            try:
+                return int(value) if value is not None else None
+            except ValueError:
+                return None
+
+        remaining_tokens = header_int("x-ratelimit-remaining-tokens")
+        remaining_requests = header_int("x-ratelimit-remaining-requests")
+        if remaining_tokens is None and remaining_requests is None:
+            return
+
+        with self._lock:
+            self._server = (time.time(), remaining_tokens, remaining_requests)
+        logger.info(f"{self.name} Rate Limit: {remaining_tokens} tokens / {remaining_requests} requests remaining")
+
+
+    # Returns how long to wait before retrying a throttled (429) response
+    def retry_delay(self, response):
+
+        retry_after_ms = response.headers.get("retry-after-ms")
+        retry_after = response.headers.get("Retry-After")
+        try:
+            if retry_after_ms:
+                return max(float(retry_after_ms) / 1000, 1.0)
+            if retry_after:
+                return max(float(retry_after), 1.0)
+        except ValueError:
+            pass
+        return 10.0
+
+
+    def wait(self, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.wait_seconds += seconds
+        time.sleep(seconds)
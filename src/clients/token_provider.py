@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+import time
+from src.clients import http_client
+
+logger = logging.getLogger(__name__)
+
+class TokenProvider:
+
+    # Caches a client-credentials access token until shortly before it expires, optionally persisted to cache_path so warm
+    # workers and later runs on the same host reuse it. One lock serializes refreshes, concurrent callers wait for and share a single token request
+    def __init__(self, token_url, client_id, client_secret, scope, cache_path=None, refresh_margin=300):
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+
+        self._token = None
+        self._expires_at = 0.0 # wall-clock epoch seconds, comparable with the disk cache
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+
+    # Returns a valid access token, requesting a new one when none is cached or it is within refresh_margin seconds of expiring
+    # Pass the token a request was rejected with (401) to discard it, callers that already hold a newer token are not refreshed again
+    def get_token(self, rejected_token=None):
+
+        with self._lock:
+            if rejected_token and rejected_token == self._token:
+                logger.info("Access token was rejected, discarding it.")
+                self._token = None
+                self._expires_at = 0.0
+                self._remove_disk_token(rejected_token)
+
+            if self._is_fresh():
+                return self._token
+
+            if not rejected_token and self._load_disk_token() and self._is_fresh():
+                return self._token
+
+            self._refresh()
+            return self._token
+
+
+    def _is_fresh(self):
+        return bool(self._token) and time.time() < self._expires_at - self.refresh_margin
+
+
+    def _refresh(self):
+
+        data = {
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'scope': self.scope,
+            'grant_type': 'client_credentials'
+        }
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        response = http_client.post(self.token_url, data=data, headers=headers)
+
+        if response.status_code != 200:
+            logger.error(f"Failed to obtain access token: {response.status_code}, {response.text}")
+            return
+
+        body = response.json()
+        self._token = body.get('access_token')
+        self._expires_at = time.time() + int(body.get('expires_in', 3599))
+        self.refreshes += 1
+        logger.info(f"Obtained access token, valid for {int(self._expires_at - time.time())}s")
+        self._save_disk_token()
+
+
+    # Reads the persisted token when it belongs to this client, returns True when one was loaded
+    def _load_disk_token(self):
+
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, encoding="utf-8") as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Unable to read token cache {self.cache_path}: {e}")
+            return False
+
+        if cached.get("client_id") != self.client_id or cached.get("scope") != self.scope:
+            return False
+        self._token = cached.get("access_token")
+        self._expires_at = float(cached.get("expires_at", 0))
+        return True
+
+
+    # Writes the token through a temporary file readable only by the current user, so concurrent workers never see a partial file
+    def _save_disk_token(self):
+
+        if not self.cache_path:
+            return
+        temp_path = f"{self.cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as cache_file:
+                json.dump({
+                    "client_id": self.client_id,
+                    "scope": self.scope,
+                    "access_token": self._token,
+                    "expires_at": self._expires_at
+                }, cache_file)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            logger.error(f"Unable to write token cache {self.cache_path}: {e}")
+
+
+    def _remove_disk_token(self, token):
+
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, encoding="utf-8") as cache_file:
+                if json.load(cache_file).get("access_token") != token:
+                    return
+            os.remove(self.cache_path)
+        except (OSError, ValueError):
+            pass
@@ -6,15 +6,37 @@ class Config:
     # ClickUp API credentials
     CLICKUP_API_TOKEN = os.getenv("CLICKUP_API_TOKEN")
     CLICKUP_USERS_LIST_ID = os.getenv("CLICKUP_USERS_LIST_ID")
+    CLICKUP_RATE_LIMIT = int(os.getenv("CLICKUP_RATE_LIMIT", "100")) # requests per minute allowed for the API token
+    CLICKUP_MAX_RETRIES = int(os.getenv("CLICKUP_MAX_RETRIES", "5")) # retries of a throttled (429) request
+    CLICKUP_CASELOAD_TTL = int(os.getenv("CLICKUP_CASELOAD_TTL", "900")) # seconds the Caseload Overview email index is reused
+    CLICKUP_USERS_CACHE_TTL = int(os.getenv("CLICKUP_USERS_CACHE_TTL", "900")) # seconds the users list is reused
+    CLICKUP_FOLDER_CACHE_TTL = int(os.getenv("CLICKUP_FOLDER_CACHE_TTL", "86400")) # seconds a folder's list names are reused
+    CLICKUP_TASK_STATE_TTL = int(os.getenv("CLICKUP_TASK_STATE_TTL", "259200")) # seconds the known state of a task is kept to skip unchanged updates
+    LOCAL_CACHE_PATH = os.getenv("LOCAL_CACHE_PATH") # SQLite file for ClickUp lookups, defaults to the temp directory, ":memory:" keeps it per process
 
     # Microsoft Graph API credentials
     GRAPH_APP_CLIENT_ID = os.getenv("GRAPH_APP_CLIENT_ID")
     GRAPH_APP_CLIENT_SECRET = os.getenv("GRAPH_APP_CLIENT_SECRET")
     GRAPH_APP_URL = os.getenv("GRAPH_APP_URL")
+    GRAPH_TOKEN_CACHE_PATH = os.getenv("GRAPH_TOKEN_CACHE_PATH") # optional file the access token is persisted to for warm workers
+    GRAPH_TOKEN_REFRESH_MARGIN = int(os.getenv("GRAPH_TOKEN_REFRESH_MARGIN", "300")) # seconds before expiry a token is refreshed
+    GRAPH_USER_CACHE_TTL = int(os.getenv("GRAPH_USER_CACHE_TTL", "3600")) # seconds a resolved user (id, displayName) is reused
+    GRAPH_DELTA_SYNC = os.getenv("GRAPH_DELTA_SYNC", "false").lower() == "true" # sync calendars with calendarView/delta instead of full downloads
+    GRAPH_TRANSCRIPT_INDEX_TTL = int(os.getenv("GRAPH_TRANSCRIPT_INDEX_TTL", "300")) # seconds a user's transcript list is reused
+    GRAPH_CATEGORY_FILTER = tuple(category.strip() for category in os.getenv("GRAPH_CATEGORY_FILTER", "").split(",") if category.strip()) # Outlook categories requested server-side (exact names), empty downloads every event
 
     # OpenAI API credentials
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     OPENAI_URL = os.getenv("OPENAI_URL")
+    OPENAI_CHUNK_TOKENS = int(os.getenv("OPENAI_CHUNK_TOKENS", "12000")) # transcripts above this estimate are summarized in parts
+    OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4")) # summarization requests in flight across the process (transcripts and parts)
+    OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "40000")) # tokens per minute quota of the deployment
+    OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "240")) # requests per minute quota of the deployment
+    OPENAI_COMPLETION_TOKENS = int(os.getenv("OPENAI_COMPLETION_TOKENS", "1500")) # completion tokens reserved per request
+    OPENAI_BATCH_ENDPOINT = os.getenv("OPENAI_BATCH_ENDPOINT") # resource endpoint for the Batch API (or a local stand-in), e.g. https://<resource>.openai.azure.com
+    OPENAI_BATCH_DEPLOYMENT = os.getenv("OPENAI_BATCH_DEPLOYMENT") # global-batch deployment name
+    OPENAI_BATCH_API_VERSION = os.getenv("OPENAI_BATCH_API_VERSION", "2024-10-21")
+    OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3")) # retries of a throttled (429) request
 
     # Azure SQL Database credentials
     SQL_DATABASE = os.getenv("SQL_DATABASE")
@@ -22,6 +44,20 @@ class Config:
     SQL_PASSWORD = os.getenv("SQL_PASSWORD")
     SQL_SERVER = os.getenv("SQL_SERVER")
     SQL_USERNAME = os.getenv("SQL_USERNAME")
+    SQL_WRITE_BATCH_SIZE = int(os.getenv("SQL_WRITE_BATCH_SIZE", "500")) # buffered event writes before an automatic flush
+
+    # HTTP transport shared by the API clients
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10")) # keep-alive connections kept per host
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")) # seconds
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "300")) # seconds, long enough for GPT-4 completions
+
+    # Pipeline execution
+    MAX_USER_WORKERS = int(os.getenv("MAX_USER_WORKERS", "1")) # advisers processed in parallel, 1 keeps the sequential loop
+    PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sync").lower() # "sync" per-user loop or "async" staged asyncio pipeline
+    PIPELINE_STAGE_WORKERS = int(os.getenv("PIPELINE_STAGE_WORKERS", "4")) # concurrent items per async stage (summarize uses OPENAI_MAX_CONCURRENCY)
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "20")) # capacity of the queues between async stages
+    QUEUE_FANOUT = os.getenv("QUEUE_FANOUT", "").lower() # "user" or "event" makes the timer enqueue work items for the queue worker, empty runs everything in the timer
+    QUEUE_LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", "3600")) # seconds a dispatched work item is not dispatched again unless it succeeded, covers queue wait and retries
 
     # ClickUp folder and list IDs
     DIAGNOSTIC_ID = os.getenv("DIAGNOSTIC_ID")
@@ -1,4 +1,4 @@
-import pyodbc
+import json
 import logging
 from src.core.config import Config
 
@@ -6,14 +6,75 @@ logger = logging.getLogger(__name__)
 
 class AzureSQLClient:
 
+    STATE_CHUNK_SIZE = 1000 # event IDs per IN (...) query, well below SQL Server's 2100 parameter limit
+
+    # Upserts one buffered event: existing rows get their Outlook metadata refreshed, new rows (is_new = 1) are inserted
+    MERGE_EVENT_SQL = """
+        MERGE tblOutlookEventsY WITH (HOLDLOCK) AS target
+        USING (SELECT ? AS event_id, ? AS joinURL_id, ? AS is_cancelled, ? AS is_organizer, ? AS event_type, ? AS is_online_meeting, ? AS online_meeting_provider,
+                      ? AS response_status, ? AS subject, ? AS organizer, ? AS start_time, ? AS end_time, ? AS location, ? AS categories, ? AS duration, ? AS attendees,
+                      ? AS get_transcript, ? AS clickup_task_id, ? AS is_new) AS source
+        ON target.event_id = source.event_id
+        WHEN MATCHED THEN
+            UPDATE SET is_cancelled = source.is_cancelled, is_organizer = source.is_organizer, event_type = source.event_type, is_online_meeting = source.is_online_meeting,
+                       online_meeting_provider = source.online_meeting_provider, response_status = source.response_status, subject = source.subject, organizer = source.organizer,
+                       start_time = source.start_time, end_time = source.end_time, location = source.location, categories = source.categories, duration = source.duration,
+                       attendees = source.attendees, get_transcript = source.get_transcript
+        WHEN NOT MATCHED AND source.is_new = 1 THEN
+            INSERT (event_id, joinURL_id, is_cancelled, is_organizer, event_type, is_online_meeting, online_meeting_provider,
+                    response_status, subject, organizer, start_time, end_time, location, categories, duration, attendees,
+                    is_recording_exist, is_transcript_exist, get_transcript, get_transcript_done, summarize_transcript_done, clickup_task_id, update_clickup_done)
+            VALUES (source.event_id, source.joinURL_id, source.is_cancelled, source.is_organizer, source.event_type, source.is_online_meeting, source.online_meeting_provider,
+                    source.response_status, source.subject, source.organizer, source.start_time, source.end_time, source.location, source.categories, source.duration, source.attendees,
+                    'False', 0, source.get_transcript, 0, 0, source.clickup_task_id, 0); """
+
+    # Per-user calendar delta sync state: the Graph delta link and a snapshot of the client events in the synced window
+    CREATE_DELTA_STATE_SQL = """
+        IF OBJECT_ID('tblGraphDeltaState', 'U') IS NULL
+        CREATE TABLE tblGraphDeltaState (
+            user_email NVARCHAR(320) NOT NULL PRIMARY KEY,
+            window_start NVARCHAR(32) NOT NULL,
+            window_end NVARCHAR(32) NOT NULL,
+            delta_link NVARCHAR(MAX) NULL,
+            events_json NVARCHAR(MAX) NULL,
+            updated_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+        ) """
+
+    # Content-addressed cache of transcript summaries, keyed by a hash of the normalized transcript and the prompt version
+    CREATE_SUMMARY_CACHE_SQL = """
+        IF OBJECT_ID('tblSummaryCache', 'U') IS NULL
+        CREATE TABLE tblSummaryCache (
+            transcript_hash CHAR(64) NOT NULL PRIMARY KEY,
+            prompt_version NVARCHAR(32) NOT NULL,
+            summary NVARCHAR(MAX) NOT NULL,
+            created_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+        ) """
+
+    # Leases of queue work items, a key is only dispatched again once its item succeeded (lease released) or its lease has expired
+    CREATE_WORK_LEASE_SQL = """
+        IF OBJECT_ID('tblWorkItemLease', 'U') IS NULL
+        CREATE TABLE tblWorkItemLease (
+            item_key NVARCHAR(450) NOT NULL PRIMARY KEY,
+            lease_until DATETIME2 NOT NULL,
+            claimed_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+        ) """
+
     def __init__(self):
         self.database = Config.SQL_DATABASE
         self.driver = Config.SQL_DRIVER
         self.password = Config.SQL_PASSWORD
         self.server = Config.SQL_SERVER
         self.username = Config.SQL_USERNAME
-        self.connection = self.connect()
-        self.cursor = self.connection.cursor() if self.connection else None
+
+        # opened on first use by ensure_connection, so a warm instance can keep one connection across invocations
+        self.connection = None
+        self.cursor = None
+
+        # buffered inserts and metadata updates, written by flush_writes as one MERGE batch
+        self.write_batch_size = Config.SQL_WRITE_BATCH_SIZE
+        self._pending_writes = []
+        self._write_failures = {} # event_id -> error of rows that failed in an automatic flush, reported by the next flush_writes call
+        self._ready_tables = set()
 
 
     # Establishes a connection to the Azure SQL Database using the provided configuration
@@ -24,6 +85,8 @@ class AzureSQLClient:
             self.database
         )
 
+        import pyodbc # imported on first connection so the native ODBC driver stays out of cold-start imports
+
         connection_string = f'DRIVER={self.driver};SERVER={self.server};DATABASE={self.database};UID={self.username};PWD={self.password};Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30'
         try:
             connection = pyodbc.connect(connection_string)
@@ -33,47 +96,56 @@ class AzureSQLClient:
             logger.error(f"Error connecting to Azure SQL Database: {e}")
             return None
 
-    # This function inserts a new record into the tblOutlookEventsY table with the provided event details, transcript status, and ClickUp task ID
-    def sql_insert_new_record (self, event, get_transcript, clickup_task_id):
+    # Opens the connection on first use, a connection kept from an earlier invocation is checked with a cheap query first and reopened if it has dropped
+    # Returns True when a usable connection and cursor are available
+    def ensure_connection(self):
 
-        insert_sql = """
-            INSERT INTO tblOutlookEventsY (event_id, joinURL_id, is_cancelled, is_organizer, event_type, is_online_meeting, online_meeting_provider, 
-                                        response_status, subject, organizer, start_time, end_time, location, categories, duration, attendees,
-                                        is_recording_exist, is_transcript_exist, get_transcript, get_transcript_done, summarize_transcript_done, clickup_task_id, update_clickup_done)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) """
-        
-        try:
-            self.cursor.execute(insert_sql, (event.event_id, event.join_url, event.is_cancelled, event.is_organizer, event.event_type, event.is_online_meeting, event.online_meeting_provider, 
-                                        event.response_status, event.subject, event.organizer, event.formatted_start, event.formatted_end, event.location, 
-                                        event.categories_str, event.duration_str, event.attendees_str, 'False', False, get_transcript, False, False, clickup_task_id, False))
-            self.connection.commit()
-            logger.info(f"Added event {event.event_id} into the database.")
-            return True
-        
-        except Exception as sql_execution_error:
-            logger.error(f"Error while adding event {event.event_id} in the database: {sql_execution_error}")
-            return False
+        if self.connection and self.cursor:
+            try:
+                self.cursor.execute("SELECT 1")
+                self.cursor.fetchone()
+                return True
+            except Exception as e:
+                logger.info(f"SQL connection is no longer usable, reconnecting: {e}")
+                self.close()
+
+        self.connection = self.connect()
+        self.cursor = self.connection.cursor() if self.connection else None
+        return self.cursor is not None
+
+
+    def close(self):
+        for handle in (self.cursor, self.connection):
+            try:
+                if handle:
+                    handle.close()
+            except Exception as e:
+                logger.error(f"Error while closing the SQL connection: {e}")
+        self.cursor = None
+        self.connection = None
 
+    # This function loads the processing state of many events with chunked IN queries and returns a dict of event_id -> (get_transcript_done, summarize_transcript_done, clickup_task_id, get_transcript)
+    # Events without a record are simply absent from the dict, None is returned when the state could not be read
+    def sql_get_event_states(self, event_ids):
+
+        unique_ids = list(dict.fromkeys(event_id for event_id in event_ids if event_id))
+        states = {}
 
-    # This function updates an existing record in the tblOutlookEventsY table with the latest event details, transcript status, and ClickUp task ID based on the event_id
-    def sql_update_outlook_metadata(self, event, get_transcript):
-        update_sql = """
-            UPDATE tblOutlookEventsY
-            SET is_cancelled = ?, is_organizer = ?, event_type = ?, is_online_meeting = ?, online_meeting_provider = ?, 
-                response_status = ?, subject = ?, organizer = ?, start_time = ?, end_time = ?, location = ?, 
-                categories = ?, duration = ?, attendees = ?, get_transcript = ?
-            WHERE event_id = ? """
         try:
-            self.cursor.execute(update_sql, (event.is_cancelled, event.is_organizer, event.event_type, event.is_online_meeting, event.online_meeting_provider, 
-                                        event.response_status, event.subject, event.organizer, event.formatted_start, event.formatted_end, event.location, 
-                                        event.categories_str, event.duration_str, event.attendees_str, get_transcript, event.event_id))
-            self.connection.commit()
-            logger.info(f"Updated event {event.event_id} in the database.")
-            return True
+            for offset in range(0, len(unique_ids), self.STATE_CHUNK_SIZE):
+                chunk = unique_ids[offset:offset + self.STATE_CHUNK_SIZE]
+                placeholders = ", ".join("?" for _ in chunk)
+                select_sql = f""" SELECT event_id, get_transcript_done, summarize_transcript_done, clickup_task_id, get_transcript FROM tblOutlookEventsY WHERE event_id IN ({placeholders}) """
+                self.cursor.execute(select_sql, chunk)
+                for event_id, get_transcript_done, summarize_transcript_done, clickup_task_id, get_transcript in self.cursor.fetchall():
+                    states[event_id] = (get_transcript_done, summarize_transcript_done, clickup_task_id, get_transcript)
+
+            logger.info(f"Loaded state for {len(states)} of {len(unique_ids)} event(s) from the database.")
+            return states
 
         except Exception as sql_execution_error:
-            logger.error(f"Error while updating event {event.event_id} in the database: {sql_execution_error}")
-            return False
+            logger.error(f"Error while loading event states from the database: {sql_execution_error}")
+            return None
 
 
     # This function updates the summarized transcript and the status of transcript retrieval and summarization in the tblOutlookEventsY table based on the event_id
@@ -89,4 +161,231 @@ class AzureSQLClient:
         
         except Exception as sql_execution_error:
             logger.error(f"Error while updating event {event_id} in the database: {sql_execution_error}")
-            return False
\ No newline at end of file
+            return False
+
+
+    def _merge_params(self, event, get_transcript, clickup_task_id, is_new):
+        return (event.event_id, event.join_url, event.is_cancelled, event.is_organizer, event.event_type, event.is_online_meeting, event.online_meeting_provider,
+                event.response_status, event.subject, event.organizer, event.formatted_start, event.formatted_end, event.location,
+                event.categories_str, event.duration_str, event.attendees_str, get_transcript, clickup_task_id, is_new)
+
+
+    # This function buffers a new tblOutlookEventsY record, it is written on the next flush_writes call
+    def queue_insert_new_record(self, event, get_transcript, clickup_task_id):
+        self._pending_writes.append(self._merge_params(event, get_transcript, clickup_task_id, 1))
+        if len(self._pending_writes) >= self.write_batch_size:
+            self._write_failures = self.flush_writes()
+
+
+    # This function buffers an Outlook metadata refresh for an existing record, it is written on the next flush_writes call
+    def queue_update_outlook_metadata(self, event, get_transcript):
+        self._pending_writes.append(self._merge_params(event, get_transcript, None, 0))
+        if len(self._pending_writes) >= self.write_batch_size:
+            self._write_failures = self.flush_writes()
+
+
+    # This function writes every buffered insert and metadata update as one MERGE batch (fast_executemany) inside a single transaction
+    # If the batch fails it is rolled back and retried row by row, so one bad row does not lose the others.
+    # Returns a dict of event_id -> error for rows that failed, including the rows of automatic flushes since the last call
+    def flush_writes(self):
+
+        failures = self._write_failures
+        self._write_failures = {}
+        rows = self._pending_writes
+        self._pending_writes = []
+        if not rows:
+            return failures
+
+        try:
+            self.cursor.fast_executemany = True
+            self.cursor.executemany(self.MERGE_EVENT_SQL, rows)
+            self.connection.commit()
+            logger.info(f"Wrote {len(rows)} buffered event(s) into the database.")
+            return failures
+
+        except Exception as sql_execution_error:
+            logger.error(f"Batch write of {len(rows)} event(s) failed, retrying row by row: {sql_execution_error}")
+
+        finally:
+            self.cursor.fast_executemany = False
+
+        row_failures = {}
+        try:
+            self.connection.rollback()
+            for row in rows:
+                try:
+                    self.cursor.execute(self.MERGE_EVENT_SQL, row)
+                except Exception as sql_execution_error:
+                    row_failures[row[0]] = str(sql_execution_error)
+                    logger.error(f"Error while writing event {row[0]} in the database: {sql_execution_error}")
+            self.connection.commit()
+
+        except Exception as sql_execution_error:
+            # the connection itself is gone, none of the rows were written
+            logger.error(f"Error while writing {len(rows)} buffered event(s) in the database: {sql_execution_error}")
+            row_failures = {row[0]: str(sql_execution_error) for row in rows}
+
+        logger.info(f"Wrote {len(rows) - len(row_failures)} of {len(rows)} buffered event(s) into the database.")
+        failures.update(row_failures)
+        return failures
+
+
+
+    # Creates a helper table on first use in this connection, the CREATE statements are guarded with IF OBJECT_ID(...) IS NULL
+    def _ensure_table(self, create_sql):
+        if create_sql not in self._ready_tables:
+            self.cursor.execute(create_sql)
+            self.connection.commit()
+            self._ready_tables.add(create_sql)
+
+
+    # This function returns the stored delta sync state of a user as (window_start, window_end, delta_link, events) or None when the user has never been synced
+    def sql_get_delta_state(self, user):
+        try:
+            self._ensure_table(self.CREATE_DELTA_STATE_SQL)
+            self.cursor.execute("SELECT window_start, window_end, delta_link, events_json FROM tblGraphDeltaState WHERE user_email = ?", (user,))
+            row = self.cursor.fetchone()
+            if not row:
+                return None
+            window_start, window_end, delta_link, events_json = row
+            return window_start, window_end, delta_link, json.loads(events_json) if events_json else {}
+
+        except Exception as sql_execution_error:
+            logger.error(f"Error while reading delta state of {user}: {sql_execution_error}")
+            return None
+
+
+    # This function stores the delta link and the client event snapshot of a user after a successful sync
+    def sql_save_delta_state(self, user, window_start, window_end, delta_link, events):
+        merge_sql = """
+            MERGE tblGraphDeltaState WITH (HOLDLOCK) AS target
+            USING (SELECT ? AS user_email, ? AS window_start, ? AS window_end, ? AS delta_link, ? AS events_json) AS source
+            ON target.user_email = source.user_email
+            WHEN MATCHED THEN
+                UPDATE SET window_start = source.window_start, window_end = source.window_end, delta_link = source.delta_link,
+                           events_json = source.events_json, updated_at = SYSUTCDATETIME()
+            WHEN NOT MATCHED THEN
+                INSERT (user_email, window_start, window_end, delta_link, events_json)
+                VALUES (source.user_email, source.window_start, source.window_end, source.delta_link, source.events_json); """
+        try:
+            self._ensure_table(self.CREATE_DELTA_STATE_SQL)
+            self.cursor.execute(merge_sql, (user, window_start, window_end, delta_link, json.dumps(events)))
+            self.connection.commit()
+            return True
+
+        except Exception as sql_execution_error:
+            logger.error(f"Error while saving delta state of {user}: {sql_execution_error}")
+            return False
+
+
+    # This function flags events that were deleted from the calendar as cancelled
+    def sql_mark_events_cancelled(self, event_ids):
+        if not event_ids:
+            return True
+        try:
+            self.cursor.fast_executemany = True
+            self.cursor.executemany("UPDATE tblOutlookEventsY SET is_cancelled = 1 WHERE event_id = ?", [(event_id,) for event_id in event_ids])
+            self.connection.commit()
+            logger.info(f"Marked {len(event_ids)} removed event(s) as cancelled in the database.")
+            return True
+
+        except Exception as sql_execution_error:
+            logger.error(f"Error while marking removed events as cancelled: {sql_execution_error}")
+            return False
+
+        finally:
+            self.cursor.fast_executemany = False
+
+
+
+    # This function returns the cached summary for a transcript hash, or None when the transcript has not been summarized with the current prompt yet
+    def sql_get_cached_summary(self, transcript_hash):
+        try:
+            self._ensure_table(self.CREATE_SUMMARY_CACHE_SQL)
+            self.cursor.execute("SELECT summary FROM tblSummaryCache WHERE transcript_hash = ?", (transcript_hash,))
+            row = self.cursor.fetchone()
+            return row[0] if row else None
+
+        except Exception as sql_execution_error:
+            logger.error(f"Error while reading summary cache: {sql_execution_error}")
+            return None
+
+
+    # This function stores a summary under its transcript hash, an existing entry for the same hash is left as is
+    def sql_save_cached_summary(self, transcript_hash, prompt_version, summary):
+        insert_sql = """
+            IF NOT EXISTS (SELECT 1 FROM tblSummaryCache WHERE transcript_hash = ?)
+            INSERT INTO tblSummaryCache (transcript_hash, prompt_version, summary) VALUES (?, ?, ?) """
+        try:
+            self._ensure_table(self.CREATE_SUMMARY_CACHE_SQL)
+            self.cursor.execute(insert_sql, (transcript_hash, transcript_hash, prompt_version, summary))
+            self.connection.commit()
+            return True
+
+        except Exception as sql_execution_error:
+            logger.error(f"Error while saving summary cache: {sql_execution_error}")
+            return False
+
+
+
+    # This function claims a queue work item key for lease_seconds and returns True, False when the key is still leased, or None when the claim failed
+    # The check and the claim are one MERGE, so two dispatchers never both get the same key
+    def sql_claim_work_item(self, item_key, lease_seconds):
+        merge_sql = """
+            MERGE tblWorkItemLease WITH (HOLDLOCK) AS target
+            USING (SELECT ? AS item_key) AS source
+            ON target.item_key = source.item_key
+            WHEN MATCHED AND target.lease_until < SYSUTCDATETIME() THEN
+                UPDATE SET lease_until = DATEADD(second, ?, SYSUTCDATETIME()), claimed_at = SYSUTCDATETIME()
+            WHEN NOT MATCHED THEN
+                INSERT (item_key, lease_until) VALUES (source.item_key, DATEADD(second, ?, SYSUTCDATETIME()))
+            OUTPUT $action; """
+        try:
+            self._ensure_table(self.CREATE_WORK_LEASE_SQL)
+            self.cursor.execute(merge_sql, (item_key, lease_seconds, lease_seconds))
+            claimed = self.cursor.fetchone() is not None
+            self.connection.commit()
+            return claimed
+
+        except Exception as sql_execution_error:
+            logger.error(f"Error while claiming work item {item_key}: {sql_execution_error}")
+            try:
+                self.connection.rollback()
+            except Exception:
+                pass # the connection itself is gone, there is nothing to roll back
+            return None
+
+
+    # This function releases the lease of a work item that has been processed, so the next run can dispatch its key again
+    def sql_release_work_item(self, item_key):
+        try:
+            self._ensure_table(self.CREATE_WORK_LEASE_SQL)
+            self.cursor.execute("DELETE FROM tblWorkItemLease WHERE item_key = ?", (item_key,))
+            self.connection.commit()
+            return True
+
+        except Exception as sql_execution_error:
+            logger.error(f"Error while releasing work item {item_key}: {sql_execution_error}")
+            return False
+
+
+
+    # This function returns the records of finished, non-cancelled events in a start time range that still wait for their transcript (get_transcript_done = 0)
+    # Each row is (event_id, joinURL_id, subject, organizer, start_time, end_time, categories, duration, attendees, clickup_task_id)
+    def sql_get_pending_events(self, start_time, end_time, finished_before):
+        select_sql = """
+            SELECT event_id, joinURL_id, subject, organizer, start_time, end_time, categories, duration, attendees, clickup_task_id
+            FROM tblOutlookEventsY
+            WHERE get_transcript_done = 0 AND ISNULL(is_cancelled, 0) = 0
+              AND joinURL_id IS NOT NULL AND clickup_task_id IS NOT NULL
+              AND start_time >= ? AND start_time < ? AND end_time < ?
+            ORDER BY start_time """
+        try:
+            self.cursor.execute(select_sql, (start_time, end_time, finished_before))
+            rows = self.cursor.fetchall()
+            logger.info(f"Found {len(rows)} pending event(s) between {start_time} and {end_time}.")
+            return rows
+
+        except Exception as sql_execution_error:
+            logger.error(f"Error while loading pending events: {sql_execution_error}")
+            return None
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = "meeting-notes-cache.sqlite3"
+
+CREATE_CACHE_SQL = """
+    CREATE TABLE IF NOT EXISTS lookup_cache (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        etag TEXT NULL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY (namespace, key)
+    ) """
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    etag: Optional[str]
+    fetched_at: float # epoch seconds, comparable across processes
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+class LocalCache:
+
+    # Key-value cache of JSON documents (ClickUp users, folder lists, caseload index) in a local SQLite file, so slow-changing lookups
+    # survive across timer invocations and are shared by the workers on one host. Pass ":memory:" to keep the cache in the process only.
+    # Entries carry the ETag they were fetched with and their fetch time, callers decide freshness with their own TTL
+    def __init__(self, path=None):
+        self.path = path or os.path.join(tempfile.gettempdir(), DEFAULT_CACHE_FILE)
+        self._lock = threading.Lock()
+        self._decoded = {} # (namespace, key) -> CacheEntry, reused while the row's fetched_at is unchanged
+        self._connection = None
+
+
+    # Opens the SQLite file on first use, a cache that cannot be opened falls back to an in-memory database
+    def _connect(self):
+
+        if self._connection is None:
+            import sqlite3 # loaded on first use to keep it out of cold-start imports
+
+            try:
+                self._connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                self._connection.execute(CREATE_CACHE_SQL)
+                self._connection.commit()
+            except Exception as e:
+                logger.error(f"Unable to open local cache {self.path}, caching in memory only: {e}")
+                self._connection = sqlite3.connect(":memory:", check_same_thread=False)
+                self._connection.execute(CREATE_CACHE_SQL)
+        return self._connection
+
+
+    # Returns the CacheEntry for the key or None, the stored JSON is only decoded again when another writer refreshed the row
+    def get(self, namespace, key):
+
+        with self._lock:
+            try:
+                connection = self._connect()
+                row = connection.execute("SELECT etag, fetched_at FROM lookup_cache WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+                if row is None:
+                    self._decoded.pop((namespace, key), None)
+                    return None
+
+                etag, fetched_at = row
+                entry = self._decoded.get((namespace, key))
+                if entry and entry.fetched_at == fetched_at:
+                    return entry
+
+                value = connection.execute("SELECT value FROM lookup_cache WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()[0]
+                entry = CacheEntry(json.loads(value), etag, fetched_at)
+                self._decoded[(namespace, key)] = entry
+                return entry
+
+            except Exception as e:
+                logger.error(f"Local cache read failed for {namespace}/{key}: {e}")
+                return None
+
+
+    def set(self, namespace, key, value, etag=None):
+
+        entry = CacheEntry(value, etag, time.time())
+        with self._lock:
+            try:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO lookup_cache (namespace, key, value, etag, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), etag, entry.fetched_at)
+                )
+                connection.commit()
+                self._decoded[(namespace, key)] = entry
+            except Exception as e:
+                logger.error(f"Local cache write failed for {namespace}/{key}: {e}")
+        return entry
+
+
+    # Marks an entry as just revalidated (e.g. the server answered 304 Not Modified) without rewriting its value
+    def touch(self, namespace, key):
+
+        with self._lock:
+            try:
+                fetched_at = time.time()
+                connection = self._connect()
+                connection.execute("UPDATE lookup_cache SET fetched_at = ? WHERE namespace = ? AND key = ?", (fetched_at, namespace, key))
+                connection.commit()
+                entry = self._decoded.get((namespace, key))
+                if entry:
+                    entry.fetched_at = fetched_at
+            except Exception as e:
+                logger.error(f"Local cache update failed for {namespace}/{key}: {e}")
+
+
+    # Removes one key, or the whole namespace when no key is given
+    def delete(self, namespace, key=None):
+
+        with self._lock:
+            try:
+                connection = self._connect()
+                if key is None:
+                    connection.execute("DELETE FROM lookup_cache WHERE namespace = ?", (namespace,))
+                    self._decoded = {cache_key: entry for cache_key, entry in self._decoded.items() if cache_key[0] != namespace}
+                else:
+                    connection.execute("DELETE FROM lookup_cache WHERE namespace = ? AND key = ?", (namespace, key))
+                    self._decoded.pop((namespace, key), None)
+                connection.commit()
+            except Exception as e:
+                logger.error(f"Local cache delete failed for {namespace}/{key}: {e}")
+
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
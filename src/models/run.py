@@ -0,0 +1,58 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Set
+
+from src.models.event import EventDetails
+
+
+@dataclass
+class RunWindow:
+    utc_now: datetime
+
+    start_date: str
+    end_date: str
+
+    transcript_start_date: str
+
+
+@dataclass
+class UserRunResult:
+    user: str
+    business_advisor_name: Optional[str] = None
+
+    events_total: int = 0
+    events_client: int = 0
+    events_created: int = 0
+    events_summarized: int = 0
+    transcripts_missing: int = 0
+    summaries_failed: int = 0
+    failed_writes: int = 0
+
+    calendar_bytes: int = 0
+    calendar_parse_seconds: float = 0.0
+
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+@dataclass
+class SummaryJob:
+    event: EventDetails
+    clickup_task_id: str
+
+    transcript: str
+    transcript_key: str
+
+
+@dataclass
+class UserContext:
+    user_info: dict
+    run_result: UserRunResult
+
+    business_advisor_name: Optional[str] = None
+    changed_ids: Optional[Set[str]] = None
+    delta_state: Optional[tuple] = None
+    calendar_stats: dict = field(default_factory=dict)
+
+    started: float = 0.0
+    finished: float = 0.0
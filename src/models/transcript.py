@@ -0,0 +1,12 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class SpeakerTurn:
+    speaker: str
+
+    start: Optional[str]
+    end: Optional[str]
+
+    text: str
@@ -1,6 +1,13 @@
+from datetime import datetime
 from src.models.event import EventDetails
 from src.utils.meeting_utils import get_duration
 
+# Graph event properties read by parse_event, everything else in an event payload is ignored
+EVENT_FIELDS = (
+    "id", "subject", "organizer", "start", "end", "onlineMeeting", "isCancelled", "isOrganizer", "type",
+    "isOnlineMeeting", "onlineMeetingProvider", "responseStatus", "location", "categories", "attendees",
+)
+
 
 def parse_event(event: dict) -> EventDetails:
 
@@ -57,4 +64,57 @@ def parse_event(event: dict) -> EventDetails:
 
         attendees=attendees,
         attendees_str=", ".join(attendees) if attendees else "No Attendees",
-    )
\ No newline at end of file
+    )
+
+
+# Rebuilds an EventDetails from a tblOutlookEventsY row returned by AzureSQLClient.sql_get_pending_events
+# Only the fields stored in the table are filled, start/end times are converted back to Graph's "2024-01-31T09:00:00.0000000" format
+def event_from_record(record):
+
+    event_id, join_url, subject, organizer, start_time, end_time, categories_str, duration_str, attendees_str, _ = record
+
+    def graph_time(value):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value.strftime('%Y-%m-%dT%H:%M:%S.%f') + '0'
+
+    start = graph_time(start_time)
+    end = graph_time(end_time)
+    categories = [category.strip() for category in (categories_str or "").split(",") if category.strip()]
+    attendees = [attendee.strip() for attendee in (attendees_str or "").split(",") if attendee.strip()]
+
+    return EventDetails(
+        event_id=event_id,
+
+        subject=subject or "No Subject",
+        organizer=organizer or "Unknown Organizer",
+
+        start_time=start,
+        end_time=end,
+
+        formatted_start=start[:23].replace("T", " ") if start else None,
+        formatted_end=end[:23].replace("T", " ") if end else None,
+
+        join_url=join_url,
+
+        is_cancelled=False,
+        is_organizer=None,
+        event_type=None,
+
+        is_online_meeting=True,
+        online_meeting_provider=None,
+
+        response_status=None,
+
+        duration_str=duration_str,
+
+        location="No Location",
+
+        categories=categories,
+        categories_str=categories_str or "No Categories",
+
+        attendees=attendees,
+        attendees_str=attendees_str or "No Attendees",
+    )
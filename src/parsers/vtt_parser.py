@@ -0,0 +1,54 @@
+import re
+from src.models.transcript import SpeakerTurn
+
+# Cue timing line: 00:01:02.345 --> 00:01:05.678 (cue settings after the end time are ignored)
+TIMESTAMP_PATTERN = re.compile(r'^(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})')
+
+# A VTT voice span: <v Speaker Name>text</v> (the closing tag is optional)
+VOICE_LINE_PATTERN = re.compile(r'^<v\s+([^>]+)>(.*?)(?:</v>)?$', re.DOTALL)
+
+
+def _to_turn(payload, start, end):
+    match = VOICE_LINE_PATTERN.match(payload[0] if len(payload) == 1 else ' '.join(payload))
+    if not match:
+        return None
+    return SpeakerTurn(speaker=match.group(1).strip(), start=start, end=end, text=match.group(2).strip())
+
+
+# This function parses WebVTT lines one at a time and yields a SpeakerTurn (speaker, start, end, text) per voice cue.
+# It accepts any iterable of lines (a streamed HTTP response, a file, or already filtered text without timestamps), so a transcript never has to be held in memory as a whole.
+# A voice span that wraps over several lines is joined into one turn, cues without a <v Speaker> tag are skipped.
+def iter_vtt_turns(lines):
+
+    start = end = None
+    payload = []
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.strip()
+
+        timestamp = TIMESTAMP_PATTERN.match(line) if '-->' in line else None
+        if not line or timestamp or line.startswith('<v '):
+            if payload:
+                turn = _to_turn(payload, start, end)
+                if turn:
+                    yield turn
+                payload = []
+
+            if timestamp:
+                start, end = timestamp.group(1), timestamp.group(2)
+            elif line:
+                payload.append(line)
+            else:
+                start = end = None
+            continue
+
+        # continuation of a voice span that wraps over several lines
+        if payload and not payload[-1].endswith('</v>'):
+            payload.append(line)
+
+    if payload:
+        turn = _to_turn(payload, start, end)
+        if turn:
+            yield turn
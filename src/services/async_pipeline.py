@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.clients.openai_client import PROMPT_VERSION
+from src.core.config import Config
+from src.models.run import UserContext, UserRunResult
+
+logger = logging.getLogger(__name__)
+
+_DONE = object() # end-of-stream marker, one per consumer of a queue
+
+
+class SerializedSQLClient:
+
+    # Wraps an AzureSQLClient so its methods can be called from any thread: every call runs on one dedicated thread and the caller waits for it.
+    # A pyodbc cursor must not be shared between threads, this keeps a single connection (and its write buffer) usable by every async stage
+    def __init__(self, azuredb):
+        self._azuredb = azuredb
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql")
+
+    def __getattr__(self, name):
+        attribute = getattr(self._azuredb, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            return self._executor.submit(attribute, *args, **kwargs).result()
+        return call
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class AsyncPipeline:
+
+    # Runs MeetingService as connected asyncio stages: calendar fetch -> state check -> transcript fetch -> summarize -> ClickUp/SQL delivery.
+    # Stages are linked by bounded queues, so a slow stage applies backpressure instead of buffering a whole run, and work for different users
+    # and events overlaps across Graph, ClickUp, Azure OpenAI and SQL. The blocking clients run on threads (asyncio.to_thread) and SQL is serialized
+    # onto one thread through SerializedSQLClient
+    def __init__(self, service):
+        self.service = service
+        self.stage_workers = max(1, Config.PIPELINE_STAGE_WORKERS)
+        self.summary_workers = max(1, Config.OPENAI_MAX_CONCURRENCY)
+        self.queue_size = max(1, Config.PIPELINE_QUEUE_SIZE)
+
+
+    # Processes the active advisers and returns their UserRunResults, in the same order as active_users
+    def run(self, active_users, window):
+        return asyncio.run(self._run(active_users, window))
+
+
+    async def _run(self, active_users, window):
+
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=4 * self.stage_workers + self.summary_workers, thread_name_prefix="pipeline"))
+
+        self.window = window
+        self.sql = SerializedSQLClient(self.service.azuredb)
+        self.event_users = {} # event id -> UserContext, to attribute failed SQL writes
+        self.failed_writes = {} # event id -> error of the rows the page flushes could not write
+
+        contexts = [UserContext(user_info, UserRunResult(user=user_info['name'])) for user_info in active_users]
+        logger.info(f"Processing {len(contexts)} user(s) with the async pipeline ({self.stage_workers} workers per stage, {self.summary_workers} summarizers)")
+
+        users = asyncio.Queue()
+        for context in contexts:
+            users.put_nowait(context)
+        for _ in range(self.stage_workers):
+            users.put_nowait(_DONE)
+        pages = asyncio.Queue(maxsize=self.queue_size)
+        transcripts = asyncio.Queue(maxsize=self.queue_size)
+        summaries = asyncio.Queue(maxsize=self.queue_size)
+        deliveries = asyncio.Queue(maxsize=self.queue_size)
+
+        try:
+            await asyncio.gather(
+                self._stage(users, self.fetch_calendar, self.stage_workers, pages, self.stage_workers),
+                self._stage(pages, self.check_page, self.stage_workers, transcripts, self.stage_workers),
+                self._stage(transcripts, self.fetch_transcript, self.stage_workers, summaries, self.summary_workers),
+                self._stage(summaries, self.summarize, self.summary_workers, deliveries, self.stage_workers),
+                self._stage(deliveries, self.deliver, self.stage_workers),
+            )
+            await asyncio.to_thread(self.finish, contexts)
+        finally:
+            self.sql.shutdown()
+
+        for context in contexts:
+            context.run_result.seconds = max(context.finished - context.started, 0.0)
+        return [context.run_result for context in contexts]
+
+
+    # Runs workers that take items from inbox until the end marker and call handle(item, emit), emit puts an item on the next stage's queue
+    # An exception is recorded on the item's user (like run_user does for the sync path) and the stage carries on with the next item.
+    # Once all workers are done, one end marker per worker of the next stage is queued
+    async def _stage(self, inbox, handle, workers, outbox=None, outbox_workers=0):
+
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    return
+                context = item if isinstance(item, UserContext) else item[0]
+                try:
+                    await handle(item, outbox.put if outbox else None)
+                except Exception as e:
+                    logger.exception(f"Processing failed for {context.user_info['name']}: {e}")
+                    context.run_result.error = str(e)
+                context.finished = time.perf_counter()
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        for _ in range(outbox_workers):
+            await outbox.put(_DONE)
+
+
+    # Calendar stage: emits (context, page of events) as each calendar page is downloaded
+    async def fetch_calendar(self, context, emit):
+
+        service = self.service
+        user = context.user_info['name']
+        context.started = time.perf_counter()
+        context.business_advisor_name = await asyncio.to_thread(service.graph.get_user_id_by_email, user, "displayName")
+        context.run_result.business_advisor_name = context.business_advisor_name
+        logger.info (f"\n\n\n[ ===============================     Processing meetings for {context.business_advisor_name}     =============================== ]")
+
+        calendar_pages, context.changed_ids, context.delta_state = await asyncio.to_thread(
+            service.get_calendar_events, self.sql, user, self.window.start_date, self.window.end_date, context.calendar_stats)
+
+        calendar_pages = iter(calendar_pages)
+        while True:
+            calendar_events = await asyncio.to_thread(next, calendar_pages, None)
+            if calendar_events is None:
+                break
+            context.run_result.events_total += len(calendar_events)
+            await emit((context, calendar_events))
+
+        context.run_result.calendar_bytes = context.calendar_stats.get("bytes", 0)
+        context.run_result.calendar_parse_seconds = context.calendar_stats.get("parse_seconds", 0.0)
+
+
+    # State check stage: loads the page's SQL state in one query, creates or refreshes each client event and emits the finished ones awaiting a transcript
+    async def check_page(self, item, emit):
+
+        context, calendar_events = item
+        client_events = self.service.select_client_events(calendar_events)
+        context.run_result.events_client += len(client_events)
+
+        event_states = await asyncio.to_thread(self.sql.sql_get_event_states, [event.event_id for event in client_events])
+        if event_states is None:
+            raise RuntimeError(f"Unable to load event states for {context.user_info['name']}.")
+
+        finished = []
+        for event in client_events:
+            self.event_users[event.event_id] = context
+            result = event_states.get(event.event_id)
+
+            # counters are collected on a per-event result and merged here, so only the event loop thread updates the user's result
+            event_result = UserRunResult(user=context.user_info['name'])
+            needs_transcript = await asyncio.to_thread(
+                self.service.check_event, self.sql, context.business_advisor_name, event, result, context.changed_ids, self.window, event_result)
+            context.run_result.events_created += event_result.events_created
+
+            if needs_transcript:
+                clickup_task_id = result[2]
+                finished.append((context, event, clickup_task_id))
+
+        # write the page's new records before its transcripts move on, so a ClickUp task never outlives a failed run without its record
+        self.failed_writes.update(await asyncio.to_thread(self.sql.flush_writes))
+        for item in finished:
+            await emit(item)
+
+
+    async def fetch_transcript(self, item, emit):
+
+        context, event, clickup_task_id = item
+        job = await asyncio.to_thread(self.service.collect_transcript, self.sql, context.user_info['name'], event, clickup_task_id, self.window)
+        if job:
+            await emit((context, job))
+        else:
+            context.run_result.transcripts_missing += 1
+
+
+    # Summarize stage: answers from the summary cache when possible, otherwise summarizes (paced by the shared Azure OpenAI token budget) and caches the result
+    async def summarize(self, item, emit):
+
+        context, job = item
+        summary = await asyncio.to_thread(self.sql.sql_get_cached_summary, job.transcript_key)
+        if summary:
+            logger.info(f"Summary cache hit: {job.transcript_key[:12]}")
+        else:
+            summary = await asyncio.to_thread(self.service.summarize_transcript, job.transcript_key, job.transcript)
+            if summary:
+                await asyncio.to_thread(self.sql.sql_save_cached_summary, job.transcript_key, PROMPT_VERSION, summary)
+
+        if not summary:
+            # leave the record pending so the next run tries again
+            logger.error(f"Unable to summarize transcript of event {job.event.event_id}, it will be retried next run.")
+            context.run_result.summaries_failed += 1
+            return
+        await emit((context, job, summary))
+
+
+    async def deliver(self, item, emit):
+
+        context, job, summary = item
+        user_info = context.user_info
+        await asyncio.to_thread(self.service.deliver_summary, self.sql, user_info['name'], user_info['ai_meeting_notes_folder_id'],
+                                context.business_advisor_name, job.event, job.clickup_task_id, summary)
+        context.run_result.events_summarized += 1
+
+
+    # Writes whatever is still buffered, then advances the delta watermark of the users whose writes all succeeded
+    def finish(self, contexts):
+
+        self.failed_writes.update(self.sql.flush_writes())
+        failed_users = {}
+        for event_id in self.failed_writes:
+            context = self.event_users.get(event_id)
+            if context:
+                failed_users.setdefault(id(context), []).append(event_id)
+
+        for context in contexts:
+            failed = failed_users.get(id(context), [])
+            context.run_result.failed_writes = len(failed)
+            if failed:
+                logger.error(f"{len(failed)} event(s) for {context.user_info['name']} could not be written to the database: {failed}")
+            elif context.delta_state and not context.run_result.error:
+                new_delta_link, snapshot, removed_ids = context.delta_state
+                self.sql.sql_mark_events_cancelled(removed_ids)
+                self.sql.sql_save_delta_state(context.user_info['name'], self.window.start_date, self.window.end_date, new_delta_link, snapshot)
@@ -0,0 +1,159 @@
+import argparse
+import logging
+from datetime import date, datetime, timedelta, timezone
+
+from src.clients.openai_client import PROMPT_VERSION
+from src.core.logger import setup_logger
+from src.models.run import RunWindow
+from src.parsers.event_parser import event_from_record
+from src.services.meeting_service import MeetingService
+from src.utils.meeting_utils import extract_organizer_id_from_join_url
+
+logger = logging.getLogger(__name__)
+
+class BackfillService:
+
+    # Summarizes a backlog of pending meetings (after an outage or when onboarding an adviser) through the Azure OpenAI Batch API
+    # instead of one request at a time on the timer. Transcript lookup, caching and ClickUp filing are shared with MeetingService.
+    def __init__(self, meeting_service=None):
+        self.service = meeting_service or MeetingService()
+
+
+    # Collects a SummaryJob for every pending event organized by an active adviser between start_date and end_date (inclusive, YYYY-MM-DD)
+    # Returns a list of (job, user_info), or None when the pending events could not be read
+    def collect_jobs(self, start_date, end_date):
+
+        service = self.service
+        azuredb = service.azuredb
+
+        utc_now = datetime.now(timezone.utc)
+        end_exclusive = (date.fromisoformat(end_date) + timedelta(days=1)).isoformat()
+        finished_before = (utc_now + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S') # event times are stored in Singapore time
+
+        records = azuredb.sql_get_pending_events(f"{start_date} 00:00:00", f"{end_exclusive} 00:00:00", finished_before)
+        if records is None:
+            return None
+
+        # transcripts are looked up under the organizer, so map each active adviser's Graph id back to the adviser
+        active_users = [user_info for user_info in (service.clickup.get_users() or []) if user_info['active'] == 'Yes']
+        service.graph.prefetch_users([user_info['name'] for user_info in active_users])
+        advisers = {}
+        for user_info in active_users:
+            user_id = service.graph.get_user_id_by_email(user_info['name'], "id")
+            if user_id:
+                advisers[user_id.lower()] = user_info
+
+        window = RunWindow(utc_now, f"{start_date}T00:00:00Z", f"{end_date}T23:59:59Z", f"{start_date}T00:00:00Z")
+
+        jobs = []
+        for record in records:
+            event = event_from_record(record)
+            clickup_task_id = record[-1]
+
+            organizer_id = extract_organizer_id_from_join_url(event.join_url)
+            user_info = advisers.get((organizer_id or "").lower())
+            if not user_info:
+                logger.info(f"Skipping event {event.event_id} ({event.subject}), its organizer is not an active adviser.")
+                continue
+
+            job = service.collect_transcript(azuredb, user_info['name'], event, clickup_task_id, window)
+            if job:
+                jobs.append((job, user_info))
+
+        logger.info(f"Collected {len(jobs)} transcript(s) from {len(records)} pending event(s).")
+        return jobs
+
+
+    # Runs the backfill and releases the service's connections however it ends
+    # Pass the batch_id of an earlier run to resume waiting on it instead of submitting a new job
+    def run(self, start_date, end_date, batch_id=None, poll_seconds=60, timeout_seconds=24 * 3600):
+
+        try:
+            self.backfill(start_date, end_date, batch_id, poll_seconds, timeout_seconds)
+        finally:
+            self.service.close()
+
+
+    # Collects pending transcripts, submits the ones not in the summary cache as one batch job, waits for it and files every result
+    # Transcripts above OPENAI_CHUNK_TOKENS do not fit one batch request, they are summarized with the map-reduce path while the batch runs
+    def backfill(self, start_date, end_date, batch_id, poll_seconds, timeout_seconds):
+
+        service = self.service
+        azuredb = service.azuredb
+
+        if not azuredb.ensure_connection():
+            logger.error("Unable to connect to Azure SQL Database. Exiting the backfill.")
+            return
+
+        collected = self.collect_jobs(start_date, end_date)
+        if not collected:
+            logger.info("Nothing to backfill.")
+            return
+
+        summaries, pending = service.get_cached_summaries(azuredb, [job for job, _ in collected])
+        chunked = {key: transcript for key, transcript in pending.items() if service.openai.needs_chunking(transcript)}
+        batched = {key: transcript for key, transcript in pending.items() if key not in chunked}
+
+        if batched and not batch_id:
+            batch_requests = [service.openai.build_batch_request(key, transcript) for key, transcript in batched.items()]
+            batch_id = service.openai.submit_batch(batch_requests)
+            if not batch_id:
+                return
+
+        if chunked:
+            logger.info(f"Summarizing {len(chunked)} long transcript(s) in parts outside the batch.")
+            summaries.update(service.summarize_pending(azuredb, chunked))
+
+        if batch_id:
+            batch = service.openai.wait_for_batch(batch_id, poll_seconds, timeout_seconds)
+            status = (batch or {}).get("status")
+            if status not in ("completed", "failed", "expired", "cancelled"):
+                logger.error(f"Batch {batch_id} is still {status}, rerun with --batch-id {batch_id} to apply its results.")
+                return
+
+            for key, summary in service.openai.get_batch_results(batch).items():
+                if summary and key in batched:
+                    azuredb.sql_save_cached_summary(key, PROMPT_VERSION, summary)
+                    summaries[key] = summary
+
+        # file every summary in ClickUp and mark its event as done right away, so a failure part way leaves only unfiled events pending
+        applied = 0
+        failed = []
+        for job, user_info in collected:
+            event_id = job.event.event_id
+            summary = summaries.get(job.transcript_key)
+            if not summary:
+                logger.error(f"No summary for event {event_id}, it stays pending.")
+                failed.append(event_id)
+                continue
+
+            business_advisor_name = service.graph.get_user_id_by_email(user_info['name'], "displayName")
+            if not service.file_summary(user_info['name'], user_info['ai_meeting_notes_folder_id'], business_advisor_name, job.event, job.clickup_task_id, summary):
+                logger.error(f"Unable to file the summary of event {event_id} in ClickUp, it stays pending.")
+                failed.append(event_id)
+                continue
+
+            if not azuredb.sql_update_record(summary, event_id, 1):
+                logger.error(f"Event {event_id} was filed in ClickUp but could not be marked as done, it will be filed again on the next run.")
+                failed.append(event_id)
+                continue
+            applied += 1
+
+        logger.info(f"Backfill applied {applied} of {len(collected)} summaries.")
+        if failed:
+            logger.error(f"Backfill left {len(failed)} event(s) pending: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+
+    setup_logger()
+
+    parser = argparse.ArgumentParser(description="Summarize pending meetings in bulk through the Azure OpenAI Batch API")
+    parser.add_argument("--start", required=True, help="first meeting date to backfill (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="last meeting date to backfill (YYYY-MM-DD)")
+    parser.add_argument("--batch-id", help="resume an already submitted batch instead of creating a new one")
+    parser.add_argument("--poll-seconds", type=int, default=60, help="seconds between batch status checks")
+    parser.add_argument("--timeout-seconds", type=int, default=24 * 3600, help="give up waiting after this many seconds")
+    args = parser.parse_args()
+
+    BackfillService().run(args.start, args.end, args.batch_id, args.poll_seconds, args.timeout_seconds)
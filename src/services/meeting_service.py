@@ -1,213 +1,584 @@
 import logging
-from datetime import datetime, timedelta
-import pytz
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 from src.clients.graph_client import GraphClient
 from src.clients.clickup_client import ClickUpClient
-from src.clients.openai_client import OpenAIClient
+from src.clients.openai_client import OpenAIClient, PROMPT_VERSION
 from src.database.azure_sql import AzureSQLClient
 from src.core.config import Config
+from src.models.run import RunWindow, SummaryJob, UserRunResult
+from src.parsers.event_parser import parse_event, EVENT_FIELDS
+from src.utils.transcript_utils import transcript_hash, compact_turns
+from src.utils.iter_utils import read_ahead
 
 logger = logging.getLogger(__name__)
 
-class MeetingService:
+CLIENT_CATEGORIES = ('client - retainer', 'client - diagnostic')
 
-    # Initialize the MeetingService with instances of GraphClient, ClickUpClient, OpenAIClient, and AzureSQLClient to handle interactions with Microsoft Graph API, ClickUp API, Azure OpenAI, and Azure SQL Database respectively.
-    def __init__(self):
 
-        self.graph = GraphClient()
-        self.clickup = ClickUpClient()
-        self.openai = OpenAIClient()
-        self.azuredb = AzureSQLClient()
+# Only meetings that fall under the category of [client - retainer] or [client - diagnostic] are processed
+def is_client_category(categories_str):
+    categories = categories_str.lower()
+    return any(category in categories for category in CLIENT_CATEGORIES)
 
 
-    def main(self):
+class MeetingService:
 
-        utc_now = datetime.now(pytz.utc)
+    # Initialize the MeetingService with instances of GraphClient, ClickUpClient, OpenAIClient, and AzureSQLClient to handle interactions with Microsoft Graph API, ClickUp API, Azure OpenAI, and Azure SQL Database respectively.
+    # Clients can be passed in to replace the default ones, e.g. with stand-ins when benchmarking the pipeline
+    def __init__(self, graph=None, clickup=None, openai=None, azuredb=None):
+
+        self.graph = graph or GraphClient()
+        self.clickup = clickup or ClickUpClient()
+        self.openai = openai or OpenAIClient()
+        self.azuredb = azuredb or AzureSQLClient()
+
+        # each worker thread gets its own SQL connection when users are processed concurrently
+        self.max_user_workers = Config.MAX_USER_WORKERS
+        self._worker_local = threading.local()
+        self._worker_dbs = []
+        self._worker_dbs_lock = threading.Lock()
+
+        # transcript hash -> lock / summary, so two workers holding the same meeting summarize it only once
+        self._summary_locks = {}
+        self._summary_locks_lock = threading.Lock()
+        self._recent_summaries = {}
+
+        # user -> (first page of events, stats, next link) downloaded for all advisers at the start of a run with $batch
+        self._prefetched_calendars = {}
+
+
+    # Returns (pages of calendar events, changed event IDs, delta state to save once the events are processed) for a user, pages is an iterable of event lists
+    # In full mode every event in the window is downloaded, page by page as the caller iterates, and changed event IDs is None, meaning every event counts as changed.
+    # A first page prefetched with $batch is returned first, the pages after it are downloaded from its next link as the caller iterates.
+    # In delta mode only the Graph delta since the last run is downloaded and merged into the stored snapshot of the user's client events.
+    # Full downloads add their payload size and parse time to the optional stats dict
+    def get_calendar_events(self, azuredb, user, start_date, end_date, stats=None):
+
+        if not Config.GRAPH_DELTA_SYNC:
+            prefetched = self._prefetched_calendars.pop(user, None)
+            if prefetched:
+                calendar_events, prefetched_stats, next_link = prefetched
+                if stats is not None:
+                    stats.update(prefetched_stats)
+                if not next_link:
+                    return [calendar_events], None, None
+                return self.continue_calendar_pages(user, start_date, end_date, calendar_events, next_link, stats), None, None
+            return self.graph.get_outlook_metadata_pages(user, start_date, end_date, Config.GRAPH_CATEGORY_FILTER, stats), None, None
+
+        delta_link = None
+        snapshot = {}
+        state = azuredb.sql_get_delta_state(user)
+        if state and state[0] == start_date and state[1] == end_date: # the window moves daily, a new window needs a full sync
+            _, _, delta_link, snapshot = state
+
+        result = self.graph.get_outlook_metadata_delta(user, start_date, end_date, delta_link)
+        if result is None and delta_link:
+            snapshot = {}
+            result = self.graph.get_outlook_metadata_delta(user, start_date, end_date)
+        if result is None:
+            logger.error(f"Delta sync failed for {user}, falling back to a full calendar download.")
+            return self.graph.get_outlook_metadata_pages(user, start_date, end_date, Config.GRAPH_CATEGORY_FILTER, stats), None, None
+
+        changed_events, removed_ids, new_delta_link = result
+        changed_ids = set()
+        for raw_event in changed_events:
+            event_id = raw_event.get("id")
+            changed_ids.add(event_id)
+            if is_client_category(", ".join(raw_event.get("categories") or [])):
+                snapshot[event_id] = {field: raw_event[field] for field in EVENT_FIELDS if field in raw_event}
+            else:
+                snapshot.pop(event_id, None)
+
+        for event_id in removed_ids:
+            snapshot.pop(event_id, None)
+
+        # unchanged snapshot events are still returned so finished meetings get their transcript processed
+        calendar_events = [parse_event(raw_event) for raw_event in snapshot.values()]
+        return [calendar_events], changed_ids, (new_delta_link, snapshot, removed_ids)
+
+
+    # Yields a prefetched first calendar page, then downloads the following pages from its next link
+    def continue_calendar_pages(self, user, start_date, end_date, first_page, next_link, stats):
+        yield first_page
+        yield from self.graph.get_outlook_metadata_pages(user, start_date, end_date, Config.GRAPH_CATEGORY_FILTER, stats, next_link)
+
+
+    # Returns the SQL client for the calling thread, worker threads lazily open their own connection since a pyodbc cursor must not be shared
+    def get_azuredb(self):
+
+        if self.max_user_workers <= 1:
+            return self.azuredb
+
+        azuredb = getattr(self._worker_local, "azuredb", None)
+        if azuredb is None:
+            azuredb = AzureSQLClient()
+            azuredb.ensure_connection()
+            self._worker_local.azuredb = azuredb
+            with self._worker_dbs_lock:
+                self._worker_dbs.append(azuredb)
+        return azuredb
+
+
+    # Returns the RunWindow of a run starting now: calendar events from yesterday until the end of the day after tomorrow
+    def build_window(self):
+
+        utc_now = datetime.now(timezone.utc)
         one_day_ago = utc_now - timedelta(days=1)
         start_date = one_day_ago.strftime('%Y-%m-%dT00:00:00Z')
         end_date_utc = utc_now + timedelta(days=2)
         end_date = end_date_utc.strftime('%Y-%m-%dT23:59:59Z')
-        logger.info (f"Script started at: {utc_now}")
+        transcript_start_date = one_day_ago.replace(hour=0, minute=0, second=0, microsecond=0).strftime('%Y-%m-%dT00:00:00Z')
+        return RunWindow(utc_now, start_date, end_date, transcript_start_date)
+
+
+    # Forgets the per-run summary memo and locks and prunes the expired client caches, called at the start of every run
+    # so the service kept on a warm instance does not grow with every meeting it has seen
+    def reset_run_state(self):
+        with self._summary_locks_lock:
+            self._summary_locks.clear()
+        self._recent_summaries.clear()
+        self.graph.prune_transcript_index()
+        self.clickup.prune_task_state()
+
+
+    def main(self):
+
+        window = self.build_window()
+        logger.info (f"Script started at: {window.utc_now}")
+        self.reset_run_state()
 
-        if not self.azuredb.connection or not self.azuredb.cursor:
+        if not self.azuredb.ensure_connection():
             logger.error("Unable to connect to Azure SQL Database. Exiting the script.")
             return
         
-        logger.info(f"Processing meetings from {start_date} to {end_date}...")
+        logger.info(f"Processing meetings from {window.start_date} to {window.end_date}...")
 
-        users_list = self.clickup.get_users()
+        active_users = self.get_active_users()
+
+        # download the first calendar page of every adviser in a few $batch calls, later pages and users missing from the result are fetched in process_user
+        self._prefetched_calendars = {}
+        if not Config.GRAPH_DELTA_SYNC:
+            self._prefetched_calendars = self.graph.get_outlook_metadata_many([user_info['name'] for user_info in active_users], window.start_date, window.end_date, Config.GRAPH_CATEGORY_FILTER)
+
+        clickup_wait_before = self.clickup.rate_limit_wait_seconds
+        clickup_saved_before = self.clickup.requests_saved
+        openai_wait_before = self.openai.rate_limit_wait_seconds
+
+        results = self.run_users(active_users, window)
+        self.log_run_results(results)
+        logger.info(f"ClickUp rate limit wait: {self.clickup.rate_limit_wait_seconds - clickup_wait_before:.1f}s | ClickUp requests saved by task diffing: {self.clickup.requests_saved - clickup_saved_before} | OpenAI token budget wait: {self.openai.rate_limit_wait_seconds - openai_wait_before:.1f}s")
+
+        # worker connections belong to the pool's threads and are closed, the main connection is kept for the next warm invocation
+        with self._worker_dbs_lock:
+            for azuredb in self._worker_dbs:
+                azuredb.close()
+            self._worker_dbs.clear()
+
+
+    # Returns the users list entries of the active advisers, every adviser's Graph id and display name is resolved in a few $batch calls
+    def get_active_users(self):
+
+        users_list = self.clickup.get_users() or []
         # users_list = [{'name': 'tech@theoutperformer.co', 'ai_meeting_notes_folder_id': '123456789100', 'active': 'No'}]
         # logger.info(f"Retrieved list of users: {users_list}")
 
-        for user_info in users_list:
-
-            user = user_info['name'] # current user's email address
-            ai_folder_id = user_info['ai_meeting_notes_folder_id'] # current user's AI Meeting Notes folder ID
-            is_active = user_info['active'] # current user's active status
-            business_advisor_name = self.graph.get_user_id_by_email(user, "displayName") # current user's display name
+        self.graph.prefetch_users([user_info['name'] for user_info in users_list])
 
-            if is_active != 'Yes':
+        active_users = []
+        for user_info in users_list:
+            if user_info['active'] != 'Yes':
+                business_advisor_name = self.graph.get_user_id_by_email(user_info['name'], "displayName")
                 logger.info (f"\n\n\n[ ===============================     Skipping inactive user {business_advisor_name}     =============================== ]")
                 continue
-            logger.info (f"\n\n\n[ ===============================     Processing meetings for {business_advisor_name}     =============================== ]")
-            logger.info (f"user: {user}")
-            logger.info (f"ai_folder_id: {ai_folder_id}\n")
+            active_users.append(user_info)
+        return active_users
 
-            calendar_events = self.graph.get_outlook_metadata(user, start_date, end_date)
 
-            for event in calendar_events:
+    # Processes the active advisers with the configured PIPELINE_MODE and returns their UserRunResults
+    # "async" runs the staged asyncio pipeline, "sync" the per-user loop (on MAX_USER_WORKERS threads when above 1)
+    def run_users(self, active_users, window):
 
-                get_transcript = 0
+        started = time.perf_counter()
+        if Config.PIPELINE_MODE == "async":
+            from src.services.async_pipeline import AsyncPipeline
+            results = AsyncPipeline(self).run(active_users, window)
+        elif self.max_user_workers > 1:
+            logger.info(f"Processing {len(active_users)} user(s) with {self.max_user_workers} workers")
+            with ThreadPoolExecutor(max_workers=self.max_user_workers) as executor:
+                results = list(executor.map(lambda user_info: self.run_user(user_info, window), active_users))
+        else:
+            results = [self.run_user(user_info, window) for user_info in active_users]
 
-                # exclude all meetings that don't fall under the category of [client - retainer] and [client - diagnostic]
-                if not ('client - retainer' in event.categories_str.lower() or 'client - diagnostic' in event.categories_str.lower()):
-                    logger.info("-------------------------------------------------------------------------------")
-                    logger.info (f"NOT INCLUDED | Subject: {event.subject} | Start Date/Time: {event.start_time} | Category: xxxxx")
-                    logger.info("-------------------------------------------------------------------------------\n")
-                    continue
-                else:
-                    logger.info("-------------------------------------------------------------------------------")
-                    logger.info (f"Subject: {event.subject} | Category: {event.categories_str}")
-                    logger.info (f"Start Date/Time: {event.start_time} ")
-                    logger.info("-------------------------------------------------------------------------------")
-
-                # retrieve record from sql database based on event ID
-                check_sql = """ SELECT get_transcript_done, summarize_transcript_done, clickup_task_id FROM tblOutlookEventsY WHERE event_id = ? """
-                self.azuredb.cursor.execute(check_sql, (event.event_id,))
-                result = self.azuredb.cursor.fetchone()
-
-                # logger.info(f"Database check result for event {event.event_id}: {result}")
-
-                endtime_str = event.end_time[:26]
-                endtime = datetime.fromisoformat(endtime_str).replace(tzinfo=pytz.UTC)
-                now = utc_now + timedelta(hours=8) 
-
-                if endtime < now: get_transcript = 1
-
-                # add new clickup task in Calendar Events v.001
-                if not result:
-                    clickup_task_id = self.clickup.create_clickup_task (event.subject, business_advisor_name, event.is_cancelled, event.is_cancelled, event.formatted_start, event.duration_str, event.categories_str, event.attendees_str, 0, 0, 'Pending', 0)
-                    if clickup_task_id:
-                        logger.info(f"Created ClickUp task with ID: {clickup_task_id} for event: {event.event_id}")
-                        self.azuredb.sql_insert_new_record(event, get_transcript, clickup_task_id)
-                    else:
-                        logger.error(f"Unable to create ClickUp task and add new record in SQL database.")
-                    
-                    continue
+        logger.info(f"{Config.PIPELINE_MODE} pipeline processed {len(active_users)} user(s) in {time.perf_counter() - started:.1f}s")
+        return results
 
-                # process existing events stored in database
-                get_transcript_done, summarize_transcript_done, clickup_task_id = result # SQL query results
-                logger.info(f"Existing record found in database for event: {event.event_id} | get_transcript_done: {get_transcript_done} | summarize_transcript_done: {summarize_transcript_done} | clickup_task_id: {clickup_task_id}")    
 
-                # skip processed events
-                if get_transcript_done != False and summarize_transcript_done != False:
-                    continue
+    # Returns a MeetingService for work that runs next to this one, e.g. a queue invocation while the timer runs on the same instance
+    # It shares the API clients (HTTP sessions, token, caches) but has its own SQL connection and run state, and processes on the calling thread
+    def worker_service(self):
 
-                # update event metadata in database
-                self.azuredb.sql_update_outlook_metadata(event, get_transcript)
+        worker = MeetingService(self.graph, self.clickup, self.openai, AzureSQLClient())
+        worker.max_user_workers = 1
+        return worker
 
-                # skip events that have not yet finished
-                if not get_transcript == 1:
-                    continue
 
-                # try to retrieve transcript from MS Teams and send it to Azure OpenAI for summarization
-                logger.info("Getting Transcript...")
-                filtered_vtt = None
-                summarized_transcript = None
-                user_microsoft_id = self.graph.get_user_id_by_email(user, "id")
-                logger.info(f"Microsoft ID for {user}: {user_microsoft_id}")
+    # Releases every connection held by the service, for callers that do not reuse it
+    def close(self):
+        self.azuredb.close()
 
-                if not user_microsoft_id: 
-                    logger.error(f"Unable to get Microsoft id for {user}")
-                    continue
 
-                yesterday = utc_now - timedelta(days=1)
-                start_date_Tminus1 = yesterday.replace(hour=0, minute=0, second=0, microsecond=0).strftime('%Y-%m-%dT00:00:00Z')
-                transcript_found_and_ready = False
-
-                # get transcript URL by decoding teams meeting id and match it with outlook's join URL
-                transcript_URL = self.graph.get_transcript_content_url(user_microsoft_id,event.join_url,start_date_Tminus1,end_date)
-                if transcript_URL:
-                    logger.info("Retrieving vtt...")
-                    filtered_vtt = self.graph.get_filtered_vtt(transcript_URL)
-                    
-                # get transcript contents (vtt)
-                if filtered_vtt:
-                    summarized_transcript = self.openai.summarize_func(filtered_vtt)
-                    transcript_found_and_ready = True
-
-                # transcript not found
-                if not transcript_found_and_ready and not summarized_transcript:
-                    self.clickup.update_clickup_task(clickup_task_id, 'No', 'No', 'Transcript Not Found', 'No')
-                    self.azuredb.sql_update_record(summarized_transcript, event.event_id, 0)
+    # Runs process_user for one adviser, timing it and turning an unexpected exception into an error on the user's result so other users still run
+    def run_user(self, user_info, window, deferred=None):
+
+        result = UserRunResult(user=user_info['name'])
+        started = time.perf_counter()
+        try:
+            self.process_user(user_info, window, result, deferred)
+        except Exception as e:
+            logger.exception(f"Processing failed for {user_info['name']}: {e}")
+            result.error = str(e)
+        finally:
+            # records of ClickUp tasks created before a failure are written under this user, so the next run does not create the tasks again
+            self.flush_writes(self.get_azuredb(), result)
+        result.seconds = time.perf_counter() - started
+        return result
+
+
+    # Writes the buffered records of the given SQL client and adds the rows that could not be written to the user's result
+    def flush_writes(self, azuredb, run_result):
+
+        failed_writes = azuredb.flush_writes()
+        run_result.failed_writes += len(failed_writes)
+        if failed_writes:
+            logger.error(f"{len(failed_writes)} event(s) for {run_result.user} could not be written to the database: {list(failed_writes)}")
+        return failed_writes
+
+
+    def log_run_results(self, results):
+
+        logger.info("\n\n\n[ ===============================     Run summary     =============================== ]")
+        for result in results:
+            status = f"ERROR: {result.error}" if result.error else "OK"
+            logger.info(f"{result.user} | {status} | {result.seconds:.1f}s | events: {result.events_total} | client events: {result.events_client} | created: {result.events_created} | summarized: {result.events_summarized} | transcript missing: {result.transcripts_missing} | summaries failed: {result.summaries_failed} | failed writes: {result.failed_writes} | calendar: {result.calendar_bytes / 1024:.1f} KiB parsed in {result.calendar_parse_seconds * 1000:.1f} ms")
+        logger.info(f"Processed {len(results)} user(s), {sum(1 for result in results if result.error)} with errors, {sum(result.seconds for result in results):.1f}s user time")
+
+
+    # Processes every calendar event of one active adviser and records what happened on the given UserRunResult
+    # When a deferred list is given, finished events are appended to it as (event, clickup_task_id) instead of having their transcript collected and summarized
+    def process_user(self, user_info, window, run_result, deferred=None):
+
+        azuredb = self.get_azuredb()
+        if not azuredb.connection or not azuredb.cursor:
+            raise RuntimeError("Unable to connect to Azure SQL Database.")
+
+        user = user_info['name'] # current user's email address
+        ai_folder_id = user_info['ai_meeting_notes_folder_id'] # current user's AI Meeting Notes folder ID
+        business_advisor_name = self.graph.get_user_id_by_email(user, "displayName") # current user's display name
+        run_result.business_advisor_name = business_advisor_name
+
+        logger.info (f"\n\n\n[ ===============================     Processing meetings for {business_advisor_name}     =============================== ]")
+        logger.info (f"user: {user}")
+        logger.info (f"ai_folder_id: {ai_folder_id}\n")
+
+        calendar_stats = {}
+        calendar_pages, changed_ids, delta_state = self.get_calendar_events(azuredb, user, window.start_date, window.end_date, calendar_stats)
+
+        # each page is processed while the next one downloads in the background, a calendar that is already a list of pages is iterated as is
+        summary_jobs = []
+        for calendar_events in calendar_pages if isinstance(calendar_pages, list) else read_ahead(calendar_pages):
+            run_result.events_total += len(calendar_events)
+
+            client_events = self.select_client_events(calendar_events)
+            run_result.events_client += len(client_events)
+
+            # retrieve the records of the page's client events from sql database in one go
+            event_states = azuredb.sql_get_event_states([event.event_id for event in client_events])
+            if event_states is None:
+                raise RuntimeError(f"Unable to load event states for {user}.")
+
+            for event in client_events:
+                result = event_states.get(event.event_id)
+                if deferred is not None:
+                    if self.check_event(azuredb, business_advisor_name, event, result, changed_ids, window, run_result):
+                        deferred.append((event, result[2]))
                     continue
 
-                # update both Clickup and SQL database if VVT is found and transcript is summarized
-
-                # client email as clickup reference ID
-                client_email = event.attendees_str
-                email_list = []
-
-                if isinstance(client_email, str):
-                    email_list = [email.strip() for email in client_email.split(",")]
-
-                    if user in email_list: # exclude organizer
-                        email_list.remove(user) 
-
-                task_name = None
-
-                # find company name as task in case overload by email address
-                for email in email_list:
-                    task_name_diagnostic = self.clickup.find_task_by_email(email, 'DIAGNOSTIC')
-                    if task_name_diagnostic:
-                        task_name = task_name_diagnostic
-                        break
-                    task_name_retainer = self.clickup.find_task_by_email(email, 'RETAINER')
-                    if task_name_retainer:
-                        task_name = task_name_retainer
-                        break
-
-                date_str = event.start_time
-                dt = datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S.%f0")
-                formatted_date = f"{dt.month}/{dt.day}"
-
-                ai_task_name = f"AI Notes {formatted_date}: {event.subject}"
-                task_description = summarized_transcript
-
-                # if company name is found, add task to temp folder
-                if task_name:
-                    # find clients folder then create a new task for the summarization
-                    logger.info(f"Searching Diagnostic folder in Client Delivery...")
-                    client_folder_diagnostic_id = self.clickup.find_folder_by_task_name (task_name, Config.DIAGNOSTIC_ID)
-                    if client_folder_diagnostic_id:
-                        self.clickup.add_task_to_list(client_folder_diagnostic_id, ai_task_name, task_description) # SUCCESS
-                        self.clickup.update_clickup_task(clickup_task_id, 'Yes', 'Yes', summarized_transcript, 'Yes')
-                    else:
-                        logger.info(f"Searching Retainer folder in Client Delivery...")
-                        client_folder_retainer_id = self.clickup.find_folder_by_task_name (task_name, Config.RETAINER_ID)
-                        if client_folder_retainer_id:
-                            self.clickup.add_task_to_list(client_folder_retainer_id, ai_task_name, task_description) # SUCCESS
-                            self.clickup.update_clickup_task(clickup_task_id, 'Yes', 'Yes', summarized_transcript, 'Yes')
-
-                        # if client folder cannot be found in either Retainer or Diagnostic, add to user's temp folder
-                        else: 
-                            logger.info("Task Found: Add to temp")
-                            self.clickup.add_task_to_temp_list(business_advisor_name, ai_task_name, task_description, ai_folder_id)
-                            self.clickup.update_clickup_task(clickup_task_id, 'Yes', 'Yes', summarized_transcript, 'No')
-
-                else:
-                    logger.info("Task NOT Found: Add to temp")
-                    self.clickup.add_task_to_temp_list(business_advisor_name, ai_task_name, task_description, ai_folder_id)
-                    self.clickup.update_clickup_task(clickup_task_id, 'Yes', 'Yes', summarized_transcript, 'No')
+                job = self.process_event(azuredb, user, business_advisor_name, event, result, changed_ids, window, run_result)
+                if job:
+                    summary_jobs.append(job)
 
-                # AI summarization is complete
-                self.azuredb.sql_update_record(summarized_transcript, event.event_id, 1)
-                logger.info("\n")
+            # write the page's new records and metadata updates in one transaction, before any transcript is summarized
+            self.flush_writes(azuredb, run_result)
 
-        self.azuredb.cursor.close()
-        self.azuredb.connection.close()
+        run_result.calendar_bytes = calendar_stats.get("bytes", 0)
+        run_result.calendar_parse_seconds = calendar_stats.get("parse_seconds", 0.0)
 
+        # summarize every collected transcript concurrently, then file the results in ClickUp and SQL
+        summaries = self.summarize_jobs(azuredb, summary_jobs)
+        for job in summary_jobs:
+            summarized_transcript = summaries.get(job.transcript_key)
+            if not summarized_transcript:
+                # leave the record pending so the next run tries again
+                logger.error(f"Unable to summarize transcript of event {job.event.event_id}, it will be retried next run.")
+                run_result.summaries_failed += 1
+                continue
 
-        
+            # update both Clickup and SQL database if VVT is found and transcript is summarized
+            self.deliver_summary(azuredb, user, ai_folder_id, business_advisor_name, job.event, job.clickup_task_id, summarized_transcript)
+            run_result.events_summarized += 1
+
+        # advance the delta watermark only after the changes were processed, a failed write replays the same delta next run
+        if delta_state and not run_result.failed_writes:
+            new_delta_link, snapshot, removed_ids = delta_state
+            azuredb.sql_mark_events_cancelled(removed_ids)
+            azuredb.sql_save_delta_state(user, window.start_date, window.end_date, new_delta_link, snapshot)
+
+
+    # Excludes all meetings that don't fall under the category of [client - retainer] and [client - diagnostic], also the fallback when Graph could not filter by category
+    def select_client_events(self, calendar_events):
+
+        client_events = []
+        for event in calendar_events:
+            if not is_client_category(event.categories_str):
+                logger.info("-------------------------------------------------------------------------------")
+                logger.info (f"NOT INCLUDED | Subject: {event.subject} | Start Date/Time: {event.start_time} | Category: xxxxx")
+                logger.info("-------------------------------------------------------------------------------\n")
+                continue
+            client_events.append(event)
+        return client_events
+
+
+    # Processes one client event given its SQL record (None for a new event) and, once the meeting has finished, collects its transcript
+    # Returns the SummaryJob for the summarize stage or None
+    def process_event(self, azuredb, user, business_advisor_name, event, result, changed_ids, window, run_result):
+
+        if not self.check_event(azuredb, business_advisor_name, event, result, changed_ids, window, run_result):
+            return None
+
+        # collect the transcript now, summarization runs for all of the user's finished events at once
+        clickup_task_id = result[2]
+        job = self.collect_transcript(azuredb, user, event, clickup_task_id, window)
+        if not job:
+            run_result.transcripts_missing += 1
+        return job
+
+
+    # State check of one client event: creates the ClickUp task and record of a new event and refreshes the metadata of a pending one
+    # Returns True when the event is a finished meeting whose transcript still has to be collected
+    def check_event(self, azuredb, business_advisor_name, event, result, changed_ids, window, run_result):
+
+        get_transcript = 0
+
+        logger.info("-------------------------------------------------------------------------------")
+        logger.info (f"Subject: {event.subject} | Category: {event.categories_str}")
+        logger.info (f"Start Date/Time: {event.start_time} ")
+        logger.info("-------------------------------------------------------------------------------")
+
+        # logger.info(f"Database check result for event {event.event_id}: {result}")
+
+        endtime_str = event.end_time[:26]
+        endtime = datetime.fromisoformat(endtime_str).replace(tzinfo=timezone.utc)
+        now = window.utc_now + timedelta(hours=8) 
+
+        if endtime < now: get_transcript = 1
+
+        # add new clickup task in Calendar Events v.001
+        if not result:
+            clickup_task_id = self.clickup.create_clickup_task (event.subject, business_advisor_name, event.is_cancelled, event.is_cancelled, event.formatted_start, event.duration_str, event.categories_str, event.attendees_str, 0, 0, 'Pending', 0)
+            if clickup_task_id:
+                logger.info(f"Created ClickUp task with ID: {clickup_task_id} for event: {event.event_id}")
+                azuredb.queue_insert_new_record(event, get_transcript, clickup_task_id)
+                run_result.events_created += 1
+            else:
+                logger.error(f"Unable to create ClickUp task and add new record in SQL database.")
+
+            return False
+
+        # process existing events stored in database
+        get_transcript_done, summarize_transcript_done, clickup_task_id, stored_get_transcript = result # SQL query results
+        logger.info(f"Existing record found in database for event: {event.event_id} | get_transcript_done: {get_transcript_done} | summarize_transcript_done: {summarize_transcript_done} | clickup_task_id: {clickup_task_id}")    
+
+        # skip processed events
+        if get_transcript_done != False and summarize_transcript_done != False:
+            return False
+
+        # update event metadata in database (in delta mode only when Graph reported a change or the meeting has finished since get_transcript was stored)
+        if changed_ids is None or event.event_id in changed_ids or stored_get_transcript != get_transcript:
+            azuredb.queue_update_outlook_metadata(event, get_transcript)
+
+        # skip events that have not yet finished
+        return get_transcript == 1
+
+
+    # Retrieves and compacts the transcript of a finished meeting and returns it as a SummaryJob for the summarize stage
+    # When no transcript can be found the ClickUp task and SQL record are marked accordingly and None is returned
+    def collect_transcript(self, azuredb, user, event, clickup_task_id, window):
+
+        # try to retrieve transcript from MS Teams so it can be sent to Azure OpenAI for summarization
+        logger.info("Getting Transcript...")
+        filtered_vtt = None
+        user_microsoft_id = self.graph.get_user_id_by_email(user, "id")
+        logger.info(f"Microsoft ID for {user}: {user_microsoft_id}")
+
+        if not user_microsoft_id: 
+            logger.error(f"Unable to get Microsoft id for {user}")
+            return None
+
+        # get transcript URL by decoding teams meeting id and match it with outlook's join URL
+        transcript_URL = self.graph.get_transcript_content_url(user_microsoft_id,event.join_url,window.transcript_start_date,window.end_date)
+        if transcript_URL:
+            logger.info("Retrieving vtt...")
+            transcript_turns = self.graph.get_transcript_turns(transcript_URL)
+            if transcript_turns is not None:
+                # stream the vtt straight into compaction (merged speaker turns, aliases, no fillers) to cut prompt tokens
+                compacted_vtt, compaction = compact_turns(transcript_turns)
+                if compaction['turns']:
+                    filtered_vtt = compacted_vtt
+                    logger.info(f"Transcript compacted: {compaction['cues']} cues -> {compaction['turns']} turns, ~{compaction['tokens_before']} -> ~{compaction['tokens_after']} tokens ({100 - 100 * compaction['tokens_after'] // max(compaction['tokens_before'], 1)}% saved)")
+
+        # transcript not found
+        if not filtered_vtt:
+            self.clickup.update_clickup_task(clickup_task_id, 'No', 'No', 'Transcript Not Found', 'No')
+            azuredb.sql_update_record(None, event.event_id, 0)
+            return None
+
+        return SummaryJob(event, clickup_task_id, filtered_vtt, transcript_hash(filtered_vtt, PROMPT_VERSION))
+
+
+    # Splits jobs into summaries already in the cache (transcript key -> summary) and distinct transcripts still to summarize (transcript key -> transcript)
+    def get_cached_summaries(self, azuredb, jobs):
+
+        summaries = {}
+        pending = {}
+        for job in jobs:
+            if job.transcript_key in summaries or job.transcript_key in pending:
+                continue
+            cached = azuredb.sql_get_cached_summary(job.transcript_key)
+            if cached:
+                logger.info(f"Summary cache hit: {job.transcript_key[:12]}")
+                summaries[job.transcript_key] = cached
+            else:
+                pending[job.transcript_key] = job.transcript
+        return summaries, pending
+
+
+    # Summarize stage: returns a dict of transcript key -> summary for the given jobs
+    # Cached summaries are read first, the remaining distinct transcripts are summarized concurrently (paced by the shared Azure OpenAI token budget)
+    # and the new summaries are written back to the cache. SQL is only used from the calling thread since a cursor must not be shared
+    def summarize_jobs(self, azuredb, jobs):
+
+        summaries, pending = self.get_cached_summaries(azuredb, jobs)
+        summaries.update(self.summarize_pending(azuredb, pending))
+        return summaries
+
+
+    # Summarizes distinct transcripts (transcript key -> transcript) concurrently, caches the new summaries and returns transcript key -> summary for the ones that succeeded
+    def summarize_pending(self, azuredb, pending):
+
+        if not pending:
+            return {}
+
+        logger.info(f"Summarizing {len(pending)} transcript(s) with up to {Config.OPENAI_MAX_CONCURRENCY} concurrent request(s)")
+        with ThreadPoolExecutor(max_workers=max(1, min(Config.OPENAI_MAX_CONCURRENCY, len(pending)))) as executor:
+            results = dict(zip(pending, executor.map(self.summarize_transcript, pending.keys(), pending.values())))
+
+        summaries = {}
+        for key, summary in results.items():
+            if summary:
+                azuredb.sql_save_cached_summary(key, PROMPT_VERSION, summary)
+                summaries[key] = summary
+        return summaries
+
+
+    # Summarizes one transcript with Azure OpenAI, a per-key lock makes workers of different users that hold the same meeting share one request
+    def summarize_transcript(self, key, transcript):
+
+        with self._summary_locks_lock:
+            key_lock = self._summary_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            summary = self._recent_summaries.get(key)
+            if summary:
+                return summary
+
+            summary = self.openai.summarize_func(transcript)
+            if summary:
+                self._recent_summaries[key] = summary
+            return summary
+
+
+    # Files a summary in ClickUp and marks the event as done in SQL
+    def deliver_summary(self, azuredb, user, ai_folder_id, business_advisor_name, event, clickup_task_id, summarized_transcript):
+
+        self.file_summary(user, ai_folder_id, business_advisor_name, event, clickup_task_id, summarized_transcript)
+
+        # AI summarization is complete
+        azuredb.sql_update_record(summarized_transcript, event.event_id, 1)
+        logger.info("\n")
+
+
+    # Files a summary in the client's ClickUp folder (or the adviser's temp folder) and updates the Calendar Events task
+    # Returns True when the AI Notes task was created
+    def file_summary(self, user, ai_folder_id, business_advisor_name, event, clickup_task_id, summarized_transcript):
+
+        # client email as clickup reference ID
+        client_email = event.attendees_str
+        email_list = []
+
+        if isinstance(client_email, str):
+            email_list = [email.strip() for email in client_email.split(",")]
+
+            if user in email_list: # exclude organizer
+                email_list.remove(user) 
+
+        task_name = None
+
+        # find company name as task in case overload by email address
+        for email in email_list:
+            task_name_diagnostic = self.clickup.find_task_by_email(email, 'DIAGNOSTIC')
+            if task_name_diagnostic:
+                task_name = task_name_diagnostic
+                break
+            task_name_retainer = self.clickup.find_task_by_email(email, 'RETAINER')
+            if task_name_retainer:
+                task_name = task_name_retainer
+                break
+
+        date_str = event.start_time
+        dt = datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S.%f0")
+        formatted_date = f"{dt.month}/{dt.day}"
+
+        ai_task_name = f"AI Notes {formatted_date}: {event.subject}"
+        task_description = summarized_transcript
+
+        # if company name is found, add task to temp folder
+        if task_name:
+            # find clients folder then create a new task for the summarization
+            logger.info(f"Searching Diagnostic folder in Client Delivery...")
+            client_folder_diagnostic_id = self.clickup.find_folder_by_task_name (task_name, Config.DIAGNOSTIC_ID)
+            if client_folder_diagnostic_id:
+                filed = self.clickup.add_task_to_list(client_folder_diagnostic_id, ai_task_name, task_description) # SUCCESS
+                self.clickup.update_clickup_task(clickup_task_id, 'Yes', 'Yes', summarized_transcript, 'Yes')
+            else:
+                logger.info(f"Searching Retainer folder in Client Delivery...")
+                client_folder_retainer_id = self.clickup.find_folder_by_task_name (task_name, Config.RETAINER_ID)
+                if client_folder_retainer_id:
+                    filed = self.clickup.add_task_to_list(client_folder_retainer_id, ai_task_name, task_description) # SUCCESS
+                    self.clickup.update_clickup_task(clickup_task_id, 'Yes', 'Yes', summarized_transcript, 'Yes')
+
+                # if client folder cannot be found in either Retainer or Diagnostic, add to user's temp folder
+                else: 
+                    logger.info("Task Found: Add to temp")
+                    filed = self.clickup.add_task_to_temp_list(business_advisor_name, ai_task_name, task_description, ai_folder_id)
+                    self.clickup.update_clickup_task(clickup_task_id, 'Yes', 'Yes', summarized_transcript, 'No')
+
+        else:
+            logger.info("Task NOT Found: Add to temp")
+            filed = self.clickup.add_task_to_temp_list(business_advisor_name, ai_task_name, task_description, ai_folder_id)
+            self.clickup.update_clickup_task(clickup_task_id, 'Yes', 'Yes', summarized_transcript, 'No')
 
+        return filed
@@ -0,0 +1,195 @@
+import argparse
+import json
+import logging
+from collections import deque
+from dataclasses import asdict
+from datetime import datetime
+
+from src.core.config import Config
+from src.core.logger import setup_logger
+from src.models.event import EventDetails
+from src.models.run import RunWindow, UserRunResult
+
+logger = logging.getLogger(__name__)
+
+FANOUT_MODES = ("user", "event")
+
+
+class InMemoryQueue:
+
+    # Stand-in for the Storage queue when running without Azure or Azurite: set() has the interface of the dispatcher's func.Out queue binding
+    # and drain() hands the messages to a worker in order, like the queue trigger does one message at a time
+    def __init__(self):
+        self.messages = deque()
+
+    def set(self, messages):
+        self.messages.extend(messages if isinstance(messages, list) else [messages])
+
+    # Returns the number of messages handled, a failing message is logged and dropped (the host would retry it instead)
+    def drain(self, handle):
+        handled = 0
+        while self.messages:
+            message = self.messages.popleft()
+            try:
+                handle(message)
+            except Exception as e:
+                logger.exception(f"Work item failed: {e}")
+            handled += 1
+        return handled
+
+
+class QueueService:
+
+    # Splits a run into queue work items so the Functions host can scale workers out across instances.
+    # "user" mode enqueues one item per active adviser and each worker runs the whole pipeline for its adviser.
+    # "event" mode syncs every calendar in the dispatcher (ClickUp tasks, SQL records) and enqueues one item per finished meeting awaiting
+    # its summary, so the slow transcript and Azure OpenAI work is spread out. Every item carries the dispatcher's RunWindow.
+    # Each item's key (adviser or event) is leased in SQL when it is dispatched and released once it succeeded, so an item still queued, running
+    # or being retried is not dispatched a second time by a later tick
+    def __init__(self, service):
+        self.service = service
+        self.lease_seconds = Config.QUEUE_LEASE_SECONDS
+
+
+    # Dispatcher: returns the JSON work items of a new run, to be set on the queue output binding
+    def dispatch(self, mode):
+
+        if mode not in FANOUT_MODES:
+            raise ValueError(f"Unsupported fan-out mode: {mode}")
+
+        service = self.service
+        window = service.build_window()
+        if not service.azuredb.ensure_connection():
+            logger.error("Unable to connect to Azure SQL Database. Nothing dispatched.")
+            return []
+
+        active_users = service.get_active_users()
+        window_item = {
+            "utc_now": window.utc_now.isoformat(),
+            "start_date": window.start_date,
+            "end_date": window.end_date,
+            "transcript_start_date": window.transcript_start_date
+        }
+
+        messages = []
+        leased = 0
+        unleased = 0
+
+        # enqueues the item unless its key is still leased by an earlier dispatch
+        # an item whose claim failed is enqueued without a lease, a later tick may then dispatch it again (summarize_event skips it once it is done)
+        def enqueue(lease, item):
+            nonlocal leased, unleased
+            claimed = service.azuredb.sql_claim_work_item(lease, self.lease_seconds)
+            if claimed is None:
+                logger.error(f"Unable to lease work item {lease}, enqueuing it without a lease.")
+                unleased += 1
+                messages.append(json.dumps(item))
+                return
+            if not claimed:
+                leased += 1
+                return
+            messages.append(json.dumps({**item, "lease": lease}))
+
+        if mode == "user":
+            for user_info in active_users:
+                enqueue(f"user:{user_info['name']}", {"kind": "user", "user_info": user_info, "window": window_item})
+
+        else:
+            results = []
+            for user_info in active_users:
+                deferred = []
+                results.append(service.run_user(user_info, window, deferred))
+                for event, clickup_task_id in deferred:
+                    enqueue(f"event:{event.event_id}", {"kind": "event", "user_info": user_info, "window": window_item, "event": asdict(event), "clickup_task_id": clickup_task_id})
+            service.log_run_results(results)
+
+        logger.info(f"Dispatched {len(messages)} {mode} work item(s) for {len(active_users)} active user(s), {leased} still queued or in progress")
+        if unleased:
+            logger.error(f"{unleased} work item(s) were dispatched without a lease.")
+        return messages
+
+
+    # Worker: processes one work item, raising when it failed so the queue retries it (and moves it to the poison queue after maxDequeueCount)
+    # Each item runs on its own worker service, so its SQL connection and run state are never shared with the timer or another item on the instance.
+    # The item's lease is released once it succeeded, a failed item keeps it while the queue retries it
+    def handle(self, message):
+
+        item = json.loads(message)
+        window_item = item["window"]
+        window = RunWindow(datetime.fromisoformat(window_item["utc_now"]), window_item["start_date"], window_item["end_date"], window_item["transcript_start_date"])
+        user_info = item["user_info"]
+
+        service = self.service.worker_service()
+        try:
+            if not service.azuredb.ensure_connection():
+                raise RuntimeError("Unable to connect to Azure SQL Database.")
+
+            if item["kind"] == "user":
+                result = service.run_user(user_info, window)
+            elif item["kind"] == "event":
+                result = self.summarize_event(service, user_info, window, EventDetails(**item["event"]), item["clickup_task_id"])
+            else:
+                raise ValueError(f"Unknown work item kind: {item['kind']}")
+
+            service.log_run_results([result])
+            if result.error:
+                raise RuntimeError(f"Work item for {user_info['name']} failed: {result.error}")
+
+            if item.get("lease"):
+                service.azuredb.sql_release_work_item(item["lease"])
+        finally:
+            service.close()
+
+        return result
+
+
+    # Collects, summarizes and delivers the transcript of one finished meeting, a missing transcript is recorded like in process_user
+    # The event's record is read first, an item for a meeting that has been summarized since it was dispatched is skipped so its summary is not filed twice
+    def summarize_event(self, service, user_info, window, event, clickup_task_id):
+
+        azuredb = service.azuredb
+        user = user_info['name']
+        result = UserRunResult(user=user, events_total=1, events_client=1)
+
+        event_states = azuredb.sql_get_event_states([event.event_id])
+        if event_states is None:
+            result.error = f"Unable to load the state of event {event.event_id}"
+            return result
+
+        state = event_states.get(event.event_id)
+        if state and state[0] and state[1]:
+            logger.info(f"Event {event.event_id} has already been summarized, skipping the work item.")
+            return result
+
+        job = service.collect_transcript(azuredb, user, event, clickup_task_id, window)
+        if not job:
+            result.transcripts_missing += 1
+            return result
+
+        summary = service.summarize_jobs(azuredb, [job]).get(job.transcript_key)
+        if not summary:
+            result.summaries_failed += 1
+            result.error = f"Unable to summarize transcript of event {event.event_id}"
+            return result
+
+        business_advisor_name = service.graph.get_user_id_by_email(user, "displayName")
+        service.deliver_summary(azuredb, user, user_info['ai_meeting_notes_folder_id'], business_advisor_name, event, clickup_task_id, summary)
+        result.events_summarized += 1
+        return result
+
+
+# Runs a dispatch and drains it in-process through an InMemoryQueue, for local runs without the Functions host or Azurite
+if __name__ == "__main__":
+
+    setup_logger()
+
+    parser = argparse.ArgumentParser(description="Dispatch a run into work items and process them locally")
+    parser.add_argument("--mode", choices=FANOUT_MODES, default=Config.QUEUE_FANOUT or "user")
+    args = parser.parse_args()
+
+    from src.services.service_container import get_meeting_service
+
+    queue_service = QueueService(get_meeting_service())
+    queue = InMemoryQueue()
+    queue.set(queue_service.dispatch(args.mode))
+    logger.info(f"Processed {queue.drain(queue_service.handle)} work item(s)")
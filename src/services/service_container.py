@@ -0,0 +1,23 @@
+import logging
+import threading
+from src.services.meeting_service import MeetingService
+
+logger = logging.getLogger(__name__)
+
+# Services kept at module level so a warm Functions worker reuses its clients, HTTP sessions, token, caches and SQL connection across invocations
+_meeting_service = None
+_meeting_service_lock = threading.Lock()
+
+
+# Returns the process-wide MeetingService, creating it on the first (cold) invocation
+# Construction is cheap: the Graph token and the SQL connection are only opened when first used
+def get_meeting_service():
+
+    global _meeting_service
+    with _meeting_service_lock:
+        if _meeting_service is None:
+            logger.info("Cold start, creating MeetingService.")
+            _meeting_service = MeetingService()
+        else:
+            logger.info("Warm start, reusing MeetingService.")
+        return _meeting_service
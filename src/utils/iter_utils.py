@@ -0,0 +1,43 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+# Iterates the iterable on a background thread, keeping up to depth items ready ahead of the consumer.
+# Lets the caller process one page while the next is still downloading, an exception in the producer is re-raised to the consumer
+def read_ahead(iterable, depth=1):
+
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    # blocks until the item is queued, gives up once the consumer has stopped reading
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except Exception as e:
+            put((_DONE, e))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
@@ -37,6 +37,15 @@ def extract_meeting_id_from_join_url(join_url):
     return match.group(0) if match else None
 
 
+# This function extracts the organizer's Azure AD object ID from the join URL.
+# Teams join URLs carry a context parameter such as {"Tid":"<tenant id>","Oid":"<organizer object id>"}, which tells whose transcripts to search
+# when the meeting is looked up from a stored record rather than from the organizer's own calendar.
+def extract_organizer_id_from_join_url(join_url):
+    decoded_url = urllib.parse.unquote(join_url)
+    match = re.search(r'"Oid"\s*:\s*"([0-9a-fA-F-]+)"', decoded_url)
+    return match.group(1) if match else None
+
+
 # This function decodes the encoded meeting ID from the Graph API response and extracts the actual meeting ID using a regular expression.
 # The encoded meeting ID is typically a base64 string that contains the meeting information, and we need to decode it to compare it with the meeting ID extracted from the join URL.
 # If the decoded meeting ID matches the one from the join URL, we can confirm that we have found the correct transcript for the meeting.
@@ -49,16 +58,3 @@ def extract_meeting_id_from_encoded_id(meeting_id):
     except Exception as e:
         logger.error(f"Decode error: {e}")
         return None
-
-
-# This function compares the meeting ID extracted from the join URL with the meeting ID extracted from the encoded ID.
-# If they match, it indicates that we have found the correct transcript for the meeting.
-# The function also logs the results of the comparison for debugging purposes, which can help identify any issues in the ID extraction or comparison process.
-def compare_meeting_ids(join_url, encoded_id):
-    id_from_url = extract_meeting_id_from_join_url(join_url)
-    id_from_encoded = extract_meeting_id_from_encoded_id(encoded_id)
-    if id_from_url == id_from_encoded:
-        logger.info("Get Transcript: Match found!")
-        logger.info(f"From URL: {id_from_url}")
-        logger.info(f"From Encoded: {id_from_encoded}")
-    return id_from_url == id_from_encoded
\ No newline at end of file
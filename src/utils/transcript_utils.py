@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Standalone hesitation sounds that carry no meaning for a summary, hyphenated backchannels such as "Uh-huh" or "Mm-hmm" are kept
+FILLER_PATTERN = re.compile(r'(?<![-\w])(?:u+m+|u+h+|e+r+m+|h+m+|m+h*m+|a+h+)(?![-\w])[,.]?\s*', re.IGNORECASE)
+
+SPEAKER_LEGEND_HEADER = "SPEAKERS:"
+TRANSCRIPT_HEADER = "TRANSCRIPT:"
+
+# Speaker alias at the start of a compacted turn ("S1: ...")
+SPEAKER_PREFIX_PATTERN = re.compile(r'^(S\d+: )')
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+# Rough characters-per-token ratio for English text with GPT tokenizers, used where an exact tokenizer is not available
+CHARS_PER_TOKEN = 4
+
+
+# This function estimates the number of prompt tokens a text will use.
+# It is deliberately simple (characters / 4) so it can be used for budgeting and chunking without pulling in a tokenizer dependency.
+def estimate_tokens(text):
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# This function cuts one line that is longer than max_chars into pieces of at most max_chars, at sentence ends where possible and otherwise between words.
+# The speaker alias of the line is repeated on every piece so each one still says who is talking, only a single word longer than the budget is cut mid-word.
+def split_long_line(line, max_chars):
+
+    match = SPEAKER_PREFIX_PATTERN.match(line)
+    prefix = match.group(1) if match else ''
+    budget = max(max_chars - len(prefix), 1)
+
+    units = []
+    for sentence in SENTENCE_END_PATTERN.split(line[len(prefix):].strip()):
+        if len(sentence) <= budget:
+            units.append(sentence)
+            continue
+        for word in sentence.split():
+            units.extend(word[i:i + budget] for i in range(0, len(word), budget))
+
+    pieces = []
+    current = ''
+    for unit in units:
+        if current and len(current) + 1 + len(unit) > budget:
+            pieces.append(prefix + current)
+            current = ''
+        current = f"{current} {unit}" if current else unit
+    if current:
+        pieces.append(prefix + current)
+    return pieces
+
+
+# This function splits a transcript into chunks of at most max_tokens (estimated), cutting only between lines so every chunk holds whole speaker turns.
+# A single turn that is longer than the budget on its own is cut with split_long_line so no chunk ever exceeds the limit.
+# When a header is given (e.g. the speaker legend) it is repeated at the top of every chunk and counted against the budget.
+def split_transcript(transcript, max_tokens, header=None):
+
+    max_chars = max(max_tokens * CHARS_PER_TOKEN - (len(header) + 2 if header else 0), CHARS_PER_TOKEN)
+    chunks = []
+    current = []
+    current_chars = 0
+
+    for line in transcript.splitlines():
+        if not line.strip():
+            continue
+
+        pieces = split_long_line(line, max_chars) if len(line) > max_chars else [line]
+        for piece in pieces:
+            if current and current_chars + len(piece) + 1 > max_chars:
+                chunks.append('\n'.join(current))
+                current = []
+                current_chars = 0
+            current.append(piece)
+            current_chars += len(piece) + 1
+
+    if current:
+        chunks.append('\n'.join(current))
+
+    if header:
+        chunks = [f"{header}\n\n{chunk}" for chunk in chunks]
+    return chunks
+
+
+# This function separates the speaker legend written by compact_turns from the transcript body, returning (legend or None, body)
+def split_speaker_legend(transcript):
+    if transcript.startswith(SPEAKER_LEGEND_HEADER):
+        legend, separator, body = transcript.partition(f"\n\n{TRANSCRIPT_HEADER}\n")
+        if separator:
+            return legend, body
+    return None, transcript
+
+
+# This function compacts speaker turns before they are sent for summarization.
+# Consecutive turns of the same speaker are merged, hesitation fillers are removed, and speaker names are replaced by
+# short aliases (S1, S2, ...) explained in a SPEAKERS legend at the top. Returns the compacted text and a dict with the estimated token counts.
+def compact_turns(turns):
+
+    merged = []
+    cues = 0
+    chars_before = 0
+    for turn in turns:
+        cues += 1
+        chars_before += len(turn.speaker) + len(turn.text) + 8 # as the filtered "<v Speaker>text</v>" line
+
+        text = re.sub(r'\s+', ' ', FILLER_PATTERN.sub('', turn.text)).strip()
+        if not text:
+            continue
+
+        if merged and merged[-1][0] == turn.speaker:
+            merged[-1][1].append(text)
+        else:
+            merged.append((turn.speaker, [text]))
+
+    aliases = {}
+    for speaker, _ in merged:
+        if speaker not in aliases:
+            aliases[speaker] = f"S{len(aliases) + 1}"
+
+    legend = '\n'.join([SPEAKER_LEGEND_HEADER] + [f"{alias} = {speaker}" for speaker, alias in aliases.items()])
+    body = '\n'.join(f"{aliases[speaker]}: {' '.join(texts)}" for speaker, texts in merged)
+    compacted = f"{legend}\n\n{TRANSCRIPT_HEADER}\n{body}"
+
+    stats = {
+        "tokens_before": chars_before // CHARS_PER_TOKEN + 1 if cues else 0,
+        "tokens_after": estimate_tokens(compacted),
+        "cues": cues,
+        "turns": len(merged),
+    }
+    return compacted, stats
+
+
+# This function returns a stable SHA-256 key for a transcript summarized with a given prompt version.
+# Whitespace is normalized first, so the same meeting fetched for two attendees or on a later run maps to the same key.
+def transcript_hash(transcript, prompt_version):
+    lines = (re.sub(r'\s+', ' ', line).strip() for line in transcript.splitlines())
+    normalized = '\n'.join(line for line in lines if line)
+    return hashlib.sha256(f"{prompt_version}\n{normalized}".encode('utf-8')).hexdigest()
@@ -0,0 +1,216 @@
+import json
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from src.clients import openai_client
+from src.clients.openai_client import OpenAIClient
+from src.models.transcript import SpeakerTurn
+from src.services.backfill_service import BackfillService
+from src.services.meeting_service import MeetingService
+
+ADVISER = {"name": "adviser@example.com", "ai_meeting_notes_folder_id": "folder", "active": "Yes"}
+ADVISER_ID = "0f8fad5b-d9cb-469f-a165-70867728950e"
+JOIN_URL = "https://teams.microsoft.com/l/meetup-join/19%3ameeting_{0}%40thread.v2/0?context=%7b%22Tid%22%3a%22tenant%22%2c%22Oid%22%3a%22" + ADVISER_ID + "%22%7d"
+
+
+class StubResponse:
+
+    def __init__(self, status_code, body=None, text=""):
+        self.status_code = status_code
+        self.body = body
+        self.text = text
+        self.headers = {}
+
+    def json(self):
+        return self.body
+
+
+# Stand-in for the /openai/files and /openai/batches routes, a batch completes on the second status check
+# Requests whose transcript mentions "rejected" are only written to the error file, like requests the service refuses
+class StubBatchAPI:
+
+    def __init__(self):
+        self.files = {}
+        self.batches = {}
+        self.status_checks = 0
+
+    def post(self, url, **kwargs):
+        if "/openai/files" in url:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = kwargs["files"]["file"][1].decode("utf-8")
+            return StubResponse(200, {"id": file_id})
+
+        batch_id = f"batch-{len(self.batches) + 1}"
+        self.batches[batch_id] = kwargs["json"]["input_file_id"]
+        return StubResponse(201, {"id": batch_id, "status": "validating"})
+
+    def get(self, url, **kwargs):
+        if "/openai/batches/" in url:
+            batch_id = url.split("/openai/batches/")[1].split("?")[0]
+            self.status_checks += 1
+            if self.status_checks < 2:
+                return StubResponse(200, {"id": batch_id, "status": "in_progress"})
+            return StubResponse(200, {"id": batch_id, "status": "completed", "output_file_id": f"{batch_id}-output", "error_file_id": f"{batch_id}-errors"})
+
+        file_id = url.split("/openai/files/")[1].split("/content")[0]
+        batch_id, kind = file_id.rsplit("-", 1)
+        lines = []
+        for line in self.files[self.batches[batch_id]].splitlines():
+            request = json.loads(line)
+            rejected = "rejected" in request["body"]["messages"][1]["content"]
+            if kind == "errors" and rejected:
+                lines.append({"custom_id": request["custom_id"], "response": None, "error": {"code": "content_filter", "message": "The prompt was filtered."}})
+            elif kind == "output" and not rejected:
+                body = {"choices": [{"message": {"content": f"Summary {request['custom_id'][:8]}"}}]}
+                lines.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None})
+        return StubResponse(200, text="\n".join(json.dumps(line) for line in lines))
+
+
+class StandInSQL:
+
+    def __init__(self, event_ids):
+        start = datetime(2025, 1, 6, 9, 0)
+        self.pending = [(event_id, JOIN_URL.format(event_id), f"Meeting {event_id}", ADVISER["name"], start + timedelta(days=i), start + timedelta(days=i, hours=1),
+                         "Client - Retainer", "60", f"{ADVISER['name']}, client{i}@example.com", f"task-{event_id}") for i, event_id in enumerate(event_ids)]
+        self.cached = {}
+        self.done = []
+        self.failing_updates = set()
+
+    def ensure_connection(self):
+        return True
+
+    def sql_get_pending_events(self, start_time, end_time, finished_before):
+        return self.pending
+
+    def sql_get_cached_summary(self, key):
+        return self.cached.get(key)
+
+    def sql_save_cached_summary(self, key, prompt_version, summary):
+        self.cached[key] = summary
+
+    def sql_update_record(self, summarized_transcript, event_id, transcript_done):
+        if event_id in self.failing_updates:
+            return False
+        self.done.append(event_id)
+        return True
+
+    def close(self):
+        pass
+
+
+class StandInGraph:
+
+    def prefetch_users(self, emails):
+        pass
+
+    def get_user_id_by_email(self, email, get_value):
+        return ADVISER_ID if get_value == "id" else "Adviser"
+
+    def get_transcript_content_url(self, user_id, join_url, start_date, end_date):
+        return join_url
+
+    def get_transcript_turns(self, vtt_url):
+        return iter([SpeakerTurn("Adviser", "00:00:00.000", "00:00:04.000", f"Notes for {vtt_url}")])
+
+
+class StandInClickUp:
+
+    def __init__(self):
+        self.filed = []
+        self.failing_tasks = set()
+
+    def get_users(self):
+        return [ADVISER]
+
+    def find_task_by_email(self, email, folder):
+        return None
+
+    def add_task_to_temp_list(self, business_advisor_name, task_name, task_description, folder_id):
+        if task_name in self.failing_tasks:
+            return False
+        self.filed.append(task_name)
+        return True
+
+    def update_clickup_task(self, *args):
+        pass
+
+
+class BatchResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = StubBatchAPI()
+        patcher = mock.patch.multiple(openai_client.http_client, post=self.api.post, get=self.api.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.openai = OpenAIClient()
+
+    def test_submit_wait_and_read_results(self):
+        requests = [self.openai.build_batch_request(key, f"S1: {key} call") for key in ("first", "second", "rejected")]
+        batch_id = self.openai.submit_batch(requests)
+        batch = self.openai.wait_for_batch(batch_id, 0, 60)
+        self.assertEqual(batch["status"], "completed")
+
+        with self.assertLogs(openai_client.logger, "ERROR") as logs:
+            results = self.openai.get_batch_results(batch)
+
+        self.assertEqual(results, {"first": "Summary first", "second": "Summary second", "rejected": None})
+        self.assertTrue(any("rejected" in line and "content_filter" in line for line in logs.output))
+
+    def test_batch_without_files_has_no_results(self):
+        with self.assertLogs(openai_client.logger, "ERROR"):
+            self.assertEqual(self.openai.get_batch_results({"id": "batch-1", "status": "failed"}), {})
+
+
+class BackfillServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = StubBatchAPI()
+        patcher = mock.patch.multiple(openai_client.http_client, post=self.api.post, get=self.api.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.clickup = StandInClickUp()
+
+    def backfill(self, event_ids):
+        self.azuredb = StandInSQL(event_ids)
+        service = MeetingService(StandInGraph(), self.clickup, OpenAIClient(), self.azuredb)
+        BackfillService(service).run("2025-01-01", "2025-01-31", poll_seconds=0, timeout_seconds=60)
+
+    def test_every_summary_is_filed_and_marked_done(self):
+        self.backfill(["a", "b", "c"])
+
+        self.assertEqual(len(self.api.batches), 1)
+        self.assertEqual(len(self.clickup.filed), 3)
+        self.assertEqual(self.azuredb.done, ["a", "b", "c"])
+        self.assertEqual(len(self.azuredb.cached), 3)
+
+    def test_rejected_request_stays_pending(self):
+        self.backfill(["a", "rejected"])
+
+        self.assertEqual(self.azuredb.done, ["a"])
+        self.assertEqual(len(self.clickup.filed), 1)
+
+    def test_unfiled_summary_is_not_marked_done(self):
+        self.clickup.failing_tasks.add("AI Notes 1/7: Meeting b")
+        with self.assertLogs("src.services.backfill_service", "ERROR") as logs:
+            self.backfill(["a", "b", "c"])
+
+        self.assertEqual(self.azuredb.done, ["a", "c"])
+        self.assertIn("pending: b", logs.output[-1])
+
+    def test_cached_summaries_are_not_resubmitted(self):
+        self.backfill(["a"])
+        cached = dict(self.azuredb.cached)
+
+        self.azuredb = StandInSQL(["a"])
+        self.azuredb.cached = cached
+        service = MeetingService(StandInGraph(), self.clickup, OpenAIClient(), self.azuredb)
+        BackfillService(service).run("2025-01-01", "2025-01-31", poll_seconds=0, timeout_seconds=60)
+
+        self.assertEqual(len(self.api.batches), 1)
+        self.assertEqual(self.azuredb.done, ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from src.models.transcript import SpeakerTurn
+from src.parsers.event_parser import parse_event
+from src.services.meeting_service import MeetingService
+from src.services.queue_service import InMemoryQueue, QueueService
+
+USERS = [{"name": f"adviser{i}@example.com", "ai_meeting_notes_folder_id": "folder", "active": "Yes"} for i in range(2)]
+EVENTS_PER_USER = 2
+
+
+# Records and leases shared by every stand-in connection, like the database behind them
+class StandInDatabase:
+
+    def __init__(self):
+        self.events = {} # event_id -> (get_transcript_done, summarize_transcript_done, clickup_task_id, get_transcript)
+        self.leases = set()
+        self.claims_fail = False
+
+
+class StandInSQL:
+
+    connection = cursor = True
+
+    def __init__(self, database):
+        self.database = database
+        self.pending_writes = []
+
+    def ensure_connection(self):
+        return True
+
+    def sql_get_event_states(self, event_ids):
+        return {event_id: self.database.events[event_id] for event_id in event_ids if event_id in self.database.events}
+
+    def queue_insert_new_record(self, event, get_transcript, clickup_task_id):
+        self.pending_writes.append((event.event_id, (0, 0, clickup_task_id, get_transcript)))
+
+    def queue_update_outlook_metadata(self, event, get_transcript):
+        pass
+
+    def flush_writes(self):
+        for event_id, state in self.pending_writes:
+            self.database.events.setdefault(event_id, state)
+        self.pending_writes = []
+        return {}
+
+    def sql_update_record(self, summarized_transcript, event_id, transcript_done):
+        _, _, clickup_task_id, get_transcript = self.database.events[event_id]
+        self.database.events[event_id] = (transcript_done, transcript_done, clickup_task_id, get_transcript)
+        return True
+
+    def sql_get_cached_summary(self, key):
+        return None
+
+    def sql_save_cached_summary(self, key, prompt_version, summary):
+        pass
+
+    def sql_claim_work_item(self, item_key, lease_seconds):
+        if self.database.claims_fail:
+            return None
+        if item_key in self.database.leases:
+            return False
+        self.database.leases.add(item_key)
+        return True
+
+    def sql_release_work_item(self, item_key):
+        self.database.leases.discard(item_key)
+        return True
+
+    def close(self):
+        pass
+
+
+# Every adviser has EVENTS_PER_USER client meetings that finished yesterday, each with a one-line transcript
+class StandInGraph:
+
+    def prefetch_users(self, emails):
+        pass
+
+    def get_user_id_by_email(self, email, get_value):
+        return email if get_value == "id" else email.split("@")[0].title()
+
+    def get_outlook_metadata_pages(self, user, start_date, end_date, categories=None, stats=None):
+        end = datetime.now(timezone.utc) - timedelta(days=1)
+        yield [parse_event({
+            "id": f"{user}-{i}",
+            "subject": f"Client meeting {i}",
+            "start": {"dateTime": (end - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S.0000000')},
+            "end": {"dateTime": end.strftime('%Y-%m-%dT%H:%M:%S.0000000')},
+            "categories": ["Client - Retainer"],
+            "onlineMeeting": {"joinUrl": f"https://teams.microsoft.com/l/meetup-join/{user}-{i}"},
+            "attendees": [{"emailAddress": {"address": f"client{i}@example.com"}}],
+        }) for i in range(EVENTS_PER_USER)]
+
+    def get_transcript_content_url(self, user_id, join_url, start_date, end_date):
+        return join_url
+
+    def get_transcript_turns(self, vtt_url):
+        return iter([SpeakerTurn("Adviser", "00:00:00.000", "00:00:04.000", f"Notes for {vtt_url}")])
+
+
+class StandInClickUp:
+
+    rate_limit_wait_seconds = 0.0
+    requests_saved = 0
+
+    def __init__(self):
+        self.created = []
+        self.filed = []
+
+    def get_users(self):
+        return USERS
+
+    def create_clickup_task(self, subject, *args):
+        self.created.append(subject)
+        return f"task-{len(self.created)}"
+
+    def update_clickup_task(self, *args):
+        pass
+
+    def find_task_by_email(self, email, folder):
+        return None
+
+    def add_task_to_temp_list(self, business_advisor_name, task_name, task_description, folder_id):
+        self.filed.append(task_name)
+        return True
+
+
+class StandInOpenAI:
+
+    rate_limit_wait_seconds = 0.0
+
+    def __init__(self):
+        self.available = True
+
+    def summarize_func(self, transcript):
+        return f"Summary of {len(transcript)} characters" if self.available else None
+
+
+class QueueServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        # worker services open their own connection through AzureSQLClient, it is pointed at the same stand-in database
+        self.database = StandInDatabase()
+        patcher = mock.patch("src.services.meeting_service.AzureSQLClient", lambda: StandInSQL(self.database))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.clickup = StandInClickUp()
+        self.openai = StandInOpenAI()
+        self.service = MeetingService(StandInGraph(), self.clickup, self.openai, StandInSQL(self.database))
+        self.service.max_user_workers = 1
+        self.queue_service = QueueService(self.service)
+
+    def dispatch(self, mode):
+        queue = InMemoryQueue()
+        queue.set(self.queue_service.dispatch(mode))
+        return queue
+
+    def test_event_items_are_not_dispatched_again_while_queued(self):
+        # the first tick creates the ClickUp tasks and records, the second one finds the finished meetings pending
+        self.assertEqual(len(self.dispatch("event").messages), 0)
+        queue = self.dispatch("event")
+        self.assertEqual(len(queue.messages), len(USERS) * EVENTS_PER_USER)
+        self.assertEqual(len(self.dispatch("event").messages), 0)
+
+        self.assertEqual(queue.drain(self.queue_service.handle), len(USERS) * EVENTS_PER_USER)
+        self.assertEqual(len(self.clickup.created), len(USERS) * EVENTS_PER_USER)
+        self.assertEqual(len(self.clickup.filed), len(USERS) * EVENTS_PER_USER)
+        self.assertEqual(self.database.leases, set())
+        self.assertEqual(len(self.dispatch("event").messages), 0)
+
+    def test_user_items_are_dispatched_again_once_handled(self):
+        queue = self.dispatch("user")
+        self.assertEqual(len(queue.messages), len(USERS))
+        self.assertEqual(len(self.dispatch("user").messages), 0)
+
+        queue.drain(self.queue_service.handle)
+        self.assertEqual(len(self.clickup.created), len(USERS) * EVENTS_PER_USER)
+        self.assertEqual(len(self.dispatch("user").messages), len(USERS))
+
+    def test_failed_item_keeps_its_lease(self):
+        self.dispatch("event")
+        message = self.dispatch("event").messages[0]
+
+        self.openai.available = False
+        with self.assertRaises(RuntimeError):
+            self.queue_service.handle(message)
+        self.assertIn(json.loads(message)["lease"], self.database.leases)
+        self.assertEqual(len(self.dispatch("event").messages), 0)
+
+        self.openai.available = True
+        self.queue_service.handle(message)
+        self.assertNotIn(json.loads(message)["lease"], self.database.leases)
+
+    def test_redelivered_event_item_is_not_filed_twice(self):
+        self.dispatch("event")
+        message = self.dispatch("event").messages[0]
+
+        self.queue_service.handle(message)
+        self.queue_service.handle(message)
+        self.assertEqual(len(self.clickup.filed), 1)
+
+    def test_item_whose_claim_failed_is_enqueued_without_a_lease(self):
+        self.dispatch("event")
+
+        self.database.claims_fail = True
+        with self.assertLogs("src.services.queue_service", "ERROR"):
+            queue = self.dispatch("event")
+        self.assertEqual(len(queue.messages), len(USERS) * EVENTS_PER_USER)
+        self.assertTrue(all("lease" not in json.loads(message) for message in queue.messages))
+
+        self.assertEqual(queue.drain(self.queue_service.handle), len(USERS) * EVENTS_PER_USER)
+        self.assertEqual(len(self.clickup.filed), len(USERS) * EVENTS_PER_USER)
+        self.assertEqual(self.database.leases, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
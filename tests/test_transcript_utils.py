@@ -0,0 +1,90 @@
+import unittest
+
+from src.models.transcript import SpeakerTurn
+from src.utils.transcript_utils import CHARS_PER_TOKEN, compact_turns, split_long_line, split_transcript
+
+LEGEND = "SPEAKERS:\nS1 = Alice\nS2 = Bob"
+
+
+class SplitTranscriptTest(unittest.TestCase):
+
+    def test_short_transcript_is_one_chunk(self):
+        transcript = "S1: Hello.\nS2: Hi, how are you?"
+        self.assertEqual(split_transcript(transcript, 100), [transcript])
+
+    def test_chunks_stay_within_the_token_limit(self):
+        transcript = "\n".join(f"S{i % 2 + 1}: Turn number {i} about pricing and next steps." for i in range(40))
+        chunks = split_transcript(transcript, 50, header=LEGEND)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 50 * CHARS_PER_TOKEN)
+            self.assertTrue(chunk.startswith(LEGEND + "\n\n"))
+
+    def test_chunks_are_cut_between_turns(self):
+        turns = [f"S{i % 2 + 1}: Turn number {i} about pricing and next steps." for i in range(40)]
+        chunks = split_transcript("\n".join(turns), 50, header=LEGEND)
+
+        body_lines = [line for chunk in chunks for line in chunk[len(LEGEND) + 2:].splitlines()]
+        self.assertEqual(body_lines, turns)
+
+    def test_blank_lines_are_dropped(self):
+        self.assertEqual(split_transcript("S1: One.\n\n   \nS2: Two.", 100), ["S1: One.\nS2: Two."])
+
+    def test_long_turn_is_split_within_the_limit(self):
+        line = "S1: " + "We reviewed the quarterly numbers in detail. " * 30
+        chunks = split_transcript(line, 25)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 25 * CHARS_PER_TOKEN)
+
+
+class SplitLongLineTest(unittest.TestCase):
+
+    def test_pieces_break_at_sentence_ends(self):
+        line = "S1: First point. Second point. Third point."
+        self.assertEqual(split_long_line(line, 34), ["S1: First point. Second point.", "S1: Third point."])
+
+    def test_every_piece_keeps_the_speaker_alias(self):
+        line = "S2: " + " ".join(f"word{i}" for i in range(60))
+        pieces = split_long_line(line, 40)
+
+        self.assertGreater(len(pieces), 1)
+        for piece in pieces:
+            self.assertTrue(piece.startswith("S2: "))
+            self.assertLessEqual(len(piece), 40)
+
+    def test_words_are_not_split(self):
+        words = [f"word{i}" for i in range(60)]
+        pieces = split_long_line("S1: " + " ".join(words), 40)
+        self.assertEqual([word for piece in pieces for word in piece[len("S1: "):].split()], words)
+
+    def test_overlong_word_is_cut_to_the_budget(self):
+        pieces = split_long_line("S1: " + "x" * 50, 20)
+        self.assertEqual(pieces, ["S1: " + "x" * 16, "S1: " + "x" * 16, "S1: " + "x" * 16, "S1: xx"])
+
+    def test_line_without_alias(self):
+        pieces = split_long_line("One sentence here. Another sentence there.", 20)
+        self.assertEqual(pieces, ["One sentence here.", "Another sentence", "there."])
+
+
+class CompactTurnsTest(unittest.TestCase):
+
+    def compact(self, *texts):
+        compacted, _ = compact_turns(SpeakerTurn("Alice", "00:00:00.000", "00:00:01.000", text) for text in texts)
+        return compacted.split("TRANSCRIPT:\n", 1)[1]
+
+    def test_standalone_fillers_are_removed(self):
+        self.assertEqual(self.compact("Um, so we uh agreed. Erm, hmm fine."), "S1: so we agreed. fine.")
+
+    def test_hyphenated_backchannels_are_kept(self):
+        self.assertEqual(self.compact("Uh-huh. Um, fine."), "S1: Uh-huh. fine.")
+        self.assertEqual(self.compact("Mm-hmm"), "S1: Mm-hmm")
+
+    def test_words_containing_fillers_are_kept(self):
+        self.assertEqual(self.compact("The umbrella and the human."), "S1: The umbrella and the human.")
+
+
+if __name__ == "__main__":
+    unittest.main()
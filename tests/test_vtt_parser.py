@@ -0,0 +1,66 @@
+import unittest
+
+from src.parsers.vtt_parser import iter_vtt_turns
+
+
+def parse(vtt):
+    return [(turn.speaker, turn.start, turn.end, turn.text) for turn in iter_vtt_turns(vtt.splitlines())]
+
+
+class IterVttTurnsTest(unittest.TestCase):
+
+    def test_one_turn_per_voice_cue(self):
+        vtt = """WEBVTT
+
+00:00:01.000 --> 00:00:04.000
+<v Alice Tan>Good morning everyone.</v>
+
+00:00:04.500 --> 00:00:06.000
+<v Bob Lim>Morning.</v>
+"""
+        self.assertEqual(parse(vtt), [
+            ("Alice Tan", "00:00:01.000", "00:00:04.000", "Good morning everyone."),
+            ("Bob Lim", "00:00:04.500", "00:00:06.000", "Morning."),
+        ])
+
+    def test_multi_line_cue_is_joined(self):
+        vtt = """WEBVTT
+
+00:00:01.000 --> 00:00:09.000
+<v Alice Tan>Let us go through the numbers
+for the last quarter
+before we decide.</v>
+"""
+        self.assertEqual(parse(vtt), [("Alice Tan", "00:00:01.000", "00:00:09.000", "Let us go through the numbers for the last quarter before we decide.")])
+
+    def test_cue_without_speaker_tag_is_skipped(self):
+        vtt = """WEBVTT
+
+00:00:01.000 --> 00:00:02.000
+Background noise
+
+00:00:02.000 --> 00:00:03.000
+<v Bob Lim>Can you hear me?</v>
+"""
+        self.assertEqual(parse(vtt), [("Bob Lim", "00:00:02.000", "00:00:03.000", "Can you hear me?")])
+
+    def test_cue_identifiers_and_settings_are_ignored(self):
+        vtt = """WEBVTT
+
+3f2a/12-0
+00:00:01.000 --> 00:00:02.000 align:start
+<v Alice Tan>Hello.</v>
+"""
+        self.assertEqual(parse(vtt), [("Alice Tan", "00:00:01.000", "00:00:02.000", "Hello.")])
+
+    def test_missing_closing_tag_and_bytes(self):
+        lines = [b"WEBVTT", b"", b"00:00:01.000 --> 00:00:02.000", b"<v Alice Tan>No closing tag"]
+        self.assertEqual([(turn.speaker, turn.text) for turn in iter_vtt_turns(lines)], [("Alice Tan", "No closing tag")])
+
+    def test_filtered_lines_without_timestamps(self):
+        lines = ["<v Alice Tan>First.</v>", "<v Bob Lim>Second.</v>"]
+        self.assertEqual(parse("\n".join(lines)), [("Alice Tan", None, None, "First."), ("Bob Lim", None, None, "Second.")])
+
+
+if __name__ == "__main__":
+    unittest.main()